@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shkarik.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,10 +75,30 @@ WSGI_APPLICATION = 'main.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Настройки SQLite для нескольких воркеров. WAL: читатели не ждут писателя
+# и наоборот. synchronous=NORMAL в режиме WAL не портит базу, при сбое ОС
+# теряются лишь последние коммиты. busy_timeout: сколько ждать чужую запись
+# (мс), прежде чем вернуть "database is locked"
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,   # в КиБ, то есть ~32 МБ страничного кэша на соединение
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            # Каждый transaction.atomic() сразу берёт блокировку записи (BEGIN IMMEDIATE)
+            # и ждёт её по busy_timeout, а не получает "database is locked"
+            # при попытке повысить блокировку посреди транзакции
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -129,15 +150,41 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Rate limiting
 RATELIMIT_ENABLE = True  # Включить в продакшене
-RATELIMIT_USE_CACHE = 'default'
+# Счётчики лимитов (shkarik/ratelimit.py) — общий файл для всех воркеров на машине
+RATELIMIT_DB = os.environ.get('RATELIMIT_DB', BASE_DIR / 'ratelimit.sqlite3')
+
+# Метрики запросов (shkarik/metrics.py): общий для всех воркеров файл и токен,
+# с которым Prometheus читает /metrics/ без входа в админку
+METRICS_DB = os.environ.get('METRICS_DB', BASE_DIR / 'metrics.sqlite3')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
 
-# Кэш (для rate limiting)
+# Журнал медленных SQL (shkarik/slowlog.py): порог в мс (None — выключен)
+# и сколько самых дорогих запросов показывать на /metrics/slow-queries/
+SLOW_QUERY_MS = 100
+SLOW_QUERY_TOP = 20
+
+# Кэш (статусы заказов, меню)
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Картинки блюд: ширины уменьшенных копий (px) и число потоков, которые
+# их готовят; 0 — обрабатывать сразу в запросе
+PRODUCT_IMAGE_WIDTHS = [240, 480, 960]
+PRODUCT_IMAGE_WORKERS = 2
+
+# Выполненные и отменённые заказы старше стольких дней переносятся
+# в архив командой archive_orders (запускать по cron, например раз в ночь)
+ORDER_ARCHIVE_AFTER_DAYS = 30
+
+# Публичные коды заказов: длина, префикс дня (формат strftime, например '%d')
+# и сколько номеров процесс резервирует за один запрос к БД
+ORDER_PUBLIC_CODE_LENGTH = 4
+ORDER_PUBLIC_CODE_DAILY_PREFIX = None
+ORDER_PUBLIC_CODE_BLOCK = 20
+
 # CSRF настройки
 CSRF_COOKIE_HTTPONLY = False  
 CSRF_COOKIE_SAMESITE = 'Lax'
@@ -1,8 +1,16 @@
-from django.contrib import admin
-from django.urls import reverse
-from django.utils.html import format_html
-from django.db.models import Sum
-from .models import Product, Order, OrderItem, Courier, Chef
+from django.contrib import admin, messages
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from .models import Product, Order, OrderItem, ArchivedOrder, Courier, Chef
+from .services import BATCH_LIMIT, change_statuses
 
 
 @admin.register(Product)
@@ -10,6 +18,12 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'price', 'available')
     list_filter = ('available',)
     search_fields = ('name',)
+    
+    def delete_queryset(self, request, queryset):
+        # Массовое удаление идёт мимо Product.delete — версию меню двигаем сами
+        with transaction.atomic():
+            super().delete_queryset(request, queryset)
+            Product.catalog_changed()
 
 
 class OrderItemInline(admin.TabularInline):
@@ -42,22 +56,52 @@ class OrderAdmin(admin.ModelAdmin):
     )
     
     list_filter = ('status', 'delivery_type', 'created_at', 'accepted_by')
-    search_fields = ('public_code', 'client_name', 'client_phone', 'accepted_by')
+    search_fields = ('public_code', 'client_name', 'client_phone', 'accepted_by__code', 'accepted_by__name')
     readonly_fields = ('public_code', 'created_at')
+    list_select_related = ('accepted_by',)
     inlines = [OrderItemInline]
     
     # НОВОЕ - показать ссылку на курьера в списке заказов
     def courier_link(self, obj):
-        if obj.accepted_by:
-            try:
-                courier = Courier.objects.get(code=obj.accepted_by)
-                url = reverse('admin:shkarik_courier_change', args=[courier.id])
-                return format_html('<a href="{}">{}</a>', url, courier.name)
-            except Courier.DoesNotExist:
-                return obj.accepted_by
+        if obj.accepted_by_id:
+            url = reverse('admin:shkarik_courier_change', args=[obj.accepted_by_id])
+            return format_html('<a href="{}">{}</a>', url, obj.accepted_by.name)
         return '—'
     courier_link.short_description = 'Курьер'
     
+    actions = ('mark_ready', 'mark_completed', 'mark_cancelled')
+    
+    def apply_status(self, request, queryset, status):
+        """
+        Массовая смена статуса по тем же правилам, что у панелей
+        (services.TRANSITIONS): пачками по одному условному UPDATE, а не save()
+        каждого заказа. Заказы, которым переход недопустим, пропускаются.
+        """
+        codes = list(queryset.values_list('public_code', flat=True))
+        results = []
+        with transaction.atomic():
+            for start in range(0, len(codes), BATCH_LIMIT):
+                results += change_statuses([(code, None, status) for code in codes[start:start + BATCH_LIMIT]])
+        
+        changed = sum(result == 'ok' for _, result, _ in results)
+        self.message_user(request, f'Изменено заказов: {changed}')
+        if changed < len(results):
+            self.message_user(
+                request, f'Пропущено (из их статуса так нельзя): {len(results) - changed}', messages.WARNING
+            )
+    
+    @admin.action(description='Отметить готовыми')
+    def mark_ready(self, request, queryset):
+        self.apply_status(request, queryset, 'ready')
+    
+    @admin.action(description='Отметить выполненными')
+    def mark_completed(self, request, queryset):
+        self.apply_status(request, queryset, 'completed')
+    
+    @admin.action(description='Отменить')
+    def mark_cancelled(self, request, queryset):
+        self.apply_status(request, queryset, 'cancelled')
+    
     fieldsets = (
         ('Информация о заказе', {
             'fields': ('public_code', 'status', 'created_at')
@@ -74,6 +118,91 @@ class OrderAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Архив только для просмотра: заказы сюда переносит archive_orders"""
+    list_display = ('public_code', 'client_name', 'client_phone', 'delivery_type', 'accepted_by',
+                    'status', 'total_price', 'created_at', 'archived_at')
+    list_filter = ('status', 'delivery_type')
+    search_fields = ('public_code', 'secret_code', 'client_name', 'client_phone')
+    list_select_related = ('accepted_by',)
+    date_hierarchy = 'created_at'
+    readonly_fields = ('items_table',)
+    exclude = ('items',)
+    
+    def items_table(self, obj):
+        return format_html_join(
+            '', '<div>{} × {} = {} сом</div>',
+            ((item.product_name, item.quantity, item.total_price) for item in obj.item_list)
+        )
+    items_table.short_description = 'Позиции'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# Заказов на одной странице истории доставок
+HISTORY_PAGE_SIZE = 50
+
+STATUS_COLORS = {
+    'completed': '#28a745',
+    'delivering': '#007bff',
+    'ready': '#ffc107',
+    'cancelled': '#dc3545'
+}
+
+
+def delivery_history_context(courier, page_url, before=None):
+    """
+    Статистика курьера и страница его заказов — живых и архивных вместе.
+
+    Пагинация по ключу: страница — это заказы с id < before, поэтому
+    дальние страницы не дороже первой даже при десятках тысяч доставок.
+    Архивный заказ сохраняет прежний id, так что обе таблицы идут одной лентой.
+    """
+    sources = (
+        (courier.orders.all(), 'admin:shkarik_order_change'),
+        (courier.archived_orders.all(), 'admin:shkarik_archivedorder_change'),
+    )
+    
+    stats = {'total_count': 0, 'completed_count': 0, 'total_revenue': 0}
+    page = []
+    for orders, change_url in sources:
+        for key, value in orders.aggregate(
+            total_count=Count('id'),
+            completed_count=Count('id', filter=Q(status='completed')),
+            total_revenue=Sum('total_price', filter=Q(status='completed'), default=0),
+        ).items():
+            stats[key] += value
+        
+        rows = orders.order_by('-id').only(
+            'id', 'public_code', 'client_name', 'address', 'total_price', 'status', 'created_at'
+        )
+        if before is not None:
+            rows = rows.filter(id__lt=before)
+        for order in rows[:HISTORY_PAGE_SIZE + 1]:
+            order.change_url = reverse(change_url, args=[order.id])
+            page.append(order)
+    
+    page.sort(key=lambda order: order.id, reverse=True)
+    has_next = len(page) > HISTORY_PAGE_SIZE
+    page = page[:HISTORY_PAGE_SIZE]
+    for order in page:
+        order.status_color = STATUS_COLORS.get(order.status, '#6c757d')
+    
+    return {
+        'courier': courier,
+        'stats': stats,
+        'orders': page,
+        'is_first_page': before is None,
+        'page_url': page_url,
+        'next_before': page[-1].id if has_next else None,
+    }
+
+
 @admin.register(Courier)
 class CourierAdmin(admin.ModelAdmin):
     list_display = (
@@ -92,117 +221,69 @@ class CourierAdmin(admin.ModelAdmin):
     
     readonly_fields = ('created_at', 'delivery_history')  # НОВОЕ
     
+    def get_queryset(self, request):
+        # Число доставок считается в том же SELECT, а не запросом на строку:
+        # живые — JOIN-ом, архивные — подзапросом (второй JOIN размножил бы строки)
+        archived = (ArchivedOrder.objects
+                    .filter(accepted_by=OuterRef('pk'), status='completed')
+                    .values('accepted_by')
+                    .annotate(count=Count('id'))
+                    .values('count'))
+        return super().get_queryset(request).annotate(
+            completed_deliveries=(
+                Count('orders', filter=Q(orders__status='completed'))
+                + Coalesce(Subquery(archived), 0)
+            )
+        )
+    
     # НОВОЕ - показать сколько всего доставок
     def total_deliveries(self, obj):
-        count = Order.objects.filter(
-            accepted_by=obj.code,
-            status='completed'
-        ).count()
-        return f"{count} шт"
+        return f"{obj.completed_deliveries} шт"
     total_deliveries.short_description = 'Всего доставок'
+    total_deliveries.admin_order_field = 'completed_deliveries'
     
     # НОВОЕ - показать историю всех доставок
     def delivery_history(self, obj):
-        orders = Order.objects.filter(
-            accepted_by=obj.code
-        ).order_by('-created_at')[:50]  # Последние 50 заказов
-        
-        if not orders:
+        if obj.pk is None:
             return "Нет доставок"
-        
-        # Статистика
-        total_count = orders.count()
-        completed_count = orders.filter(status='completed').count()
-        total_revenue = orders.filter(status='completed').aggregate(
-            Sum('total_price')
-        )['total_price__sum'] or 0
-        
-        html = f"""
-        <div style="background: #f8f9fa; padding: 20px; border-radius: 8px; margin-top: 10px;">
-            <h3 style="color: #333; margin-bottom: 15px;">📊 Статистика курьера</h3>
-            
-            <div style="display: grid; grid-template-columns: repeat(3, 1fr); gap: 15px; margin-bottom: 20px;">
-                <div style="background: white; padding: 15px; border-radius: 5px; text-align: center;">
-                    <div style="font-size: 28px; font-weight: bold; color: #007bff;">{total_count}</div>
-                    <div style="color: #666; font-size: 14px;">Всего заказов</div>
-                </div>
-                <div style="background: white; padding: 15px; border-radius: 5px; text-align: center;">
-                    <div style="font-size: 28px; font-weight: bold; color: #28a745;">{completed_count}</div>
-                    <div style="color: #666; font-size: 14px;">Выполнено</div>
-                </div>
-                <div style="background: white; padding: 15px; border-radius: 5px; text-align: center;">
-                    <div style="font-size: 28px; font-weight: bold; color: #ffc107;">{total_revenue:,}</div>
-                    <div style="color: #666; font-size: 14px;">Выручка (сом)</div>
-                </div>
-            </div>
-            
-            <h4 style="color: #333; margin-bottom: 10px;">📦 История доставок (последние 50):</h4>
-            <table style="width: 100%; border-collapse: collapse; background: white; border-radius: 5px; overflow: hidden;">
-                <thead>
-                    <tr style="background: #007bff; color: white;">
-                        <th style="padding: 12px; text-align: left;">№</th>
-                        <th style="padding: 12px; text-align: left;">Заказ</th>
-                        <th style="padding: 12px; text-align: left;">Клиент</th>
-                        <th style="padding: 12px; text-align: left;">Адрес</th>
-                        <th style="padding: 12px; text-align: left;">Сумма</th>
-                        <th style="padding: 12px; text-align: left;">Статус</th>
-                        <th style="padding: 12px; text-align: left;">Дата</th>
-                    </tr>
-                </thead>
-                <tbody>
-        """
-        
-        for idx, order in enumerate(orders, 1):
-            # Цвет статуса
-            status_colors = {
-                'completed': '#28a745',
-                'delivering': '#007bff',
-                'ready': '#ffc107',
-                'cancelled': '#dc3545'
-            }
-            status_color = status_colors.get(order.status, '#6c757d')
-            status_text = dict(Order.STATUS_CHOICES).get(order.status, order.status)
-            
-            # Ссылка на заказ
-            order_url = reverse('admin:shkarik_order_change', args=[order.id])
-            
-            # Цвет строки (чередование)
-            row_bg = '#f8f9fa' if idx % 2 == 0 else 'white'
-            
-            html += f"""
-                <tr style="background: {row_bg}; border-bottom: 1px solid #dee2e6;">
-                    <td style="padding: 12px;">{idx}</td>
-                    <td style="padding: 12px;">
-                        <a href="{order_url}" style="color: #007bff; text-decoration: none; font-weight: bold;">
-                            {order.public_code}
-                        </a>
-                    </td>
-                    <td style="padding: 12px;">{order.client_name}</td>
-                    <td style="padding: 12px; font-size: 13px; max-width: 200px; overflow: hidden; text-overflow: ellipsis;">
-                        {order.address if order.address else '—'}
-                    </td>
-                    <td style="padding: 12px; font-weight: bold;">{order.total_price} сом</td>
-                    <td style="padding: 12px;">
-                        <span style="background: {status_color}; color: white; padding: 4px 10px; border-radius: 12px; font-size: 12px; font-weight: bold;">
-                            {status_text}
-                        </span>
-                    </td>
-                    <td style="padding: 12px; font-size: 13px; color: #666;">
-                        {order.created_at.strftime('%d.%m.%Y %H:%M')}
-                    </td>
-                </tr>
-            """
-        
-        html += """
-                </tbody>
-            </table>
-        </div>
-        """
-        
-        return format_html(html)
+        return render_to_string(
+            'shkarik/admin/delivery_history.html',
+            delivery_history_context(obj, self.delivery_history_url(obj))
+        )
     
     delivery_history.short_description = 'История доставок'
     
+    def delivery_history_url(self, obj):
+        return reverse('admin:shkarik_courier_deliveries', args=[obj.pk])
+    
+    def get_urls(self):
+        return [
+            path(
+                '<path:object_id>/deliveries/',
+                self.admin_site.admin_view(self.delivery_history_view),
+                name='shkarik_courier_deliveries',
+            ),
+        ] + super().get_urls()
+    
+    def delivery_history_view(self, request, object_id):
+        """Вся история доставок курьера постранично (?before=<id> — следующая страница)"""
+        courier = self.get_object(request, unquote(object_id))
+        if courier is None:
+            raise Http404('Курьер не найден')
+        if not self.has_view_or_change_permission(request, courier):
+            raise PermissionDenied
+        
+        before = request.GET.get('before', '')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'title': f'История доставок: {courier.name}',
+            **delivery_history_context(
+                courier, self.delivery_history_url(courier), int(before) if before.isdigit() else None
+            ),
+        }
+        return TemplateResponse(request, 'shkarik/admin/courier_deliveries.html', context)
+    
     fieldsets = (
         ('Основная информация', {
             'fields': ('name', 'code', 'phone', 'is_active', 'created_at')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ShkarikConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shkarik'
+
+    def ready(self):
+        # Учёт SQL для метрик и журнал медленных запросов ставятся на соединения при их открытии
+        from . import metrics, slowlog  # noqa: F401
@@ -0,0 +1,85 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, Order, OrderItem
+from .rollups import TERMINAL_STATUSES
+
+
+# Заказов за одну транзакцию: короткие блокировки записи и id__in в пределах лимита SQLite
+ARCHIVE_BATCH = 500
+
+ARCHIVED_FIELDS = [
+    'id', 'secret_code', 'public_code', 'client_name', 'client_phone', 'delivery_type', 'address',
+    'scheduled_time', 'comment', 'total_price', 'status', 'accepted_by_id', 'created_at', 'version',
+]
+
+
+def archive_cutoff(days=None):
+    days = settings.ORDER_ARCHIVE_AFTER_DAYS if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+def archivable_orders(cutoff):
+    # (status, created_at) покрывается order_status_created_idx
+    return Order.objects.filter(status__in=TERMINAL_STATUSES, created_at__lt=cutoff)
+
+
+def archive_batch(cutoff, batch_size=ARCHIVE_BATCH):
+    """
+    Переносит до batch_size завершённых заказов старше cutoff в ArchivedOrder
+    и удаляет их вместе с позициями. Возвращает число перенесённых.
+
+    Агрегаты продаж не меняются: удаление заказа их не трогает, а пересчёт
+    (rebuild_rollups) читает и архив. Публичные коды освобождаются.
+    """
+    with transaction.atomic():
+        orders = list(archivable_orders(cutoff).values(*ARCHIVED_FIELDS)[:batch_size])
+        if not orders:
+            return 0
+
+        ids = [order['id'] for order in orders]
+        items = defaultdict(list)
+        for order_id, name, price, quantity in (OrderItem.objects.filter(order_id__in=ids).order_by('id')
+                                                .values_list('order_id', 'product_name', 'product_price', 'quantity')):
+            items[order_id].append([name, price, quantity])
+
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(**order, items=items[order['id']]) for order in orders
+        ])
+        # Без сигналов у Order и OrderItem это два DELETE ... WHERE id IN (...)
+        # и пустой SELECT незавершённых для DeletedOrder — здесь их нет
+        Order.objects.filter(id__in=ids).delete()
+    return len(orders)
+
+
+def archive_orders(days=None, batch_size=ARCHIVE_BATCH, progress=None):
+    """Архивирует пачками, пока есть что переносить; progress(перенесено) после каждой пачки"""
+    cutoff = archive_cutoff(days)
+    total = 0
+    while moved := archive_batch(cutoff, batch_size):
+        total += moved
+        if progress:
+            progress(total)
+    return total
+
+
+def find_order(secret_code, fields=None):
+    """Заказ по секретному коду: сначала живые, затем архив. None — не найден"""
+    for model in (Order, ArchivedOrder):
+        queryset = model.objects.filter(secret_code=secret_code)
+        if fields:
+            queryset = queryset.only(*fields)
+        order = queryset.first()
+        if order is not None:
+            return order
+    return None
+
+
+async def afind_order(secret_code, fields=None):
+    """find_order для async view: обе попытки одним переходом в поток БД"""
+    return await sync_to_async(find_order)(secret_code, fields)
@@ -0,0 +1,71 @@
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+# ==================== СТАТУС ЗАКАЗА ДЛЯ КЛИЕНТА ====================
+
+# С общим кэшем (Redis/Memcached) запись видна всем воркерам сразу;
+# с LocMemCache другие воркеры увидят новый статус не позже чем через TTL
+ORDER_STATUS_CACHE_SECONDS = 30
+
+
+def order_status_key(secret_code):
+    return f'order-status:{secret_code}'
+
+
+def order_status_entry(order):
+    return {
+        'etag': f'"{order.version}"',
+        'data': {
+            'public_code': order.public_code,
+            'status': order.status,
+            'status_display': order.get_status_display(),
+            'version': order.version,
+        },
+    }
+
+
+def remember_order_status(order):
+    """Кладёт статус в кэш, только если запись ещё не обновил писатель"""
+    entry = order_status_entry(order)
+    cache.add(order_status_key(order.secret_code), entry, ORDER_STATUS_CACHE_SECONDS)
+    return entry
+
+
+def refresh_order_status(order):
+    """После COMMIT перезаписывает статус в кэше свежими данными"""
+    transaction.on_commit(partial(
+        cache.set, order_status_key(order.secret_code), order_status_entry(order), ORDER_STATUS_CACHE_SECONDS
+    ))
+
+
+# ==================== МЕНЮ НА ГЛАВНОЙ ====================
+
+# Версия каталога живёт в БД (Sequence) и копируется в кэш. Писатель
+# обновляет копию сразу после COMMIT; с LocMemCache другие воркеры
+# узнают о новой версии не позже чем через MENU_VERSION_CACHE_SECONDS
+MENU_VERSION_KEY = 'menu-version'
+MENU_VERSION_CACHE_SECONDS = 60
+
+# Страница конкретной версии не устаревает — её вытесняет только новая версия
+MENU_PAGE_CACHE_SECONDS = 24 * 60 * 60
+
+
+def menu_page_key(version):
+    return f'menu-page:{version}'
+
+
+def menu_version():
+    version = cache.get(MENU_VERSION_KEY)
+    if version is None:
+        from .models import Sequence, CATALOG_VERSION_SEQUENCE
+        version = Sequence.current(CATALOG_VERSION_SEQUENCE)
+        cache.add(MENU_VERSION_KEY, version, MENU_VERSION_CACHE_SECONDS)
+    return version
+
+
+def refresh_menu_version(version):
+    """После COMMIT публикует новую версию каталога"""
+    transaction.on_commit(partial(cache.set, MENU_VERSION_KEY, version, MENU_VERSION_CACHE_SECONDS))
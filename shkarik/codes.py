@@ -0,0 +1,97 @@
+import hashlib
+import secrets
+import string
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+
+ALPHABET = string.ascii_uppercase + string.digits
+PUBLIC_CODE_MAX_LENGTH = 10   # Order.public_code.max_length
+FEISTEL_ROUNDS = 4
+
+
+# ==================== СЕКРЕТНЫЙ КОД ====================
+
+def new_secret_code():
+    """128 бит случайности — коллизия практически невозможна, проверка в БД не нужна"""
+    return secrets.token_urlsafe(16)
+
+
+# ==================== ПУБЛИЧНЫЙ КОД ====================
+
+def permute(index, modulus, key):
+    """Биекция [0, modulus) → [0, modulus): сеть Фейстеля с cycle walking"""
+    half_bits = ((modulus - 1).bit_length() + 1) // 2
+    mask = (1 << half_bits) - 1
+
+    value = index
+    while True:
+        left, right = value >> half_bits, value & mask
+        for round_no in range(FEISTEL_ROUNDS):
+            digest = hashlib.blake2b(f'{round_no}:{right}'.encode(), key=key, digest_size=8).digest()
+            left, right = right, left ^ (int.from_bytes(digest, 'big') & mask)
+        value = (left << half_bits) | right
+        if value < modulus:
+            return value
+
+
+def encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, rem = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[rem])
+    return ''.join(reversed(chars))
+
+
+class PublicCodeAllocator:
+    """
+    Выдаёт публичные коды заказов без запросов на проверку занятости.
+
+    Номера берутся блоками из последовательности в БД (один UPDATE на блок)
+    и переводятся в код через перестановку, поэтому коды не идут подряд.
+    Когда все коды цикла выданы, начинается новый цикл с другой перестановкой;
+    редкую коллизию со старым заказом ловит уникальный индекс, и вызывающий
+    код просто берёт следующий номер.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sequence = None
+        self._next = 0
+        self._end = 0
+
+    def allocate(self):
+        length = getattr(settings, 'ORDER_PUBLIC_CODE_LENGTH', 4)
+        prefix_format = getattr(settings, 'ORDER_PUBLIC_CODE_DAILY_PREFIX', None)
+        block_size = getattr(settings, 'ORDER_PUBLIC_CODE_BLOCK', 20)
+
+        prefix = timezone.localdate().strftime(prefix_format) if prefix_format else ''
+        if 1 + len(prefix) + length > PUBLIC_CODE_MAX_LENGTH:
+            raise ImproperlyConfigured('Публичный код не помещается в Order.public_code')
+
+        name = f'public:{length}:{prefix}'
+        with self._lock:
+            if self._sequence != name or self._next >= self._end:
+                from .models import Sequence
+                self._next, self._end = Sequence.reserve(name, block_size)
+                self._sequence = name
+            value = self._next
+            self._next += 1
+
+        modulus = len(ALPHABET) ** length
+        cycle, index = divmod(value, modulus)
+        key = hashlib.blake2b(f'{settings.SECRET_KEY}:{name}:{cycle}'.encode(), digest_size=32).digest()
+
+        return '#' + prefix + encode(permute(index, modulus, key), length)
+
+    def reset(self):
+        """Сбрасывает зарезервированный блок (например, после отката транзакции в тестах)"""
+        with self._lock:
+            self._sequence = None
+            self._next = self._end = 0
+
+
+public_codes = PublicCodeAllocator()
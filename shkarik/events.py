@@ -0,0 +1,96 @@
+import asyncio
+import json
+import threading
+from functools import partial
+
+from django.db import transaction
+
+
+# Как часто слать комментарий-пинг, чтобы прокси не закрывали соединение
+HEARTBEAT_SECONDS = 15
+
+
+class Subscription:
+    """Очередь событий одного подключённого клиента (живёт в его event loop)"""
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def put(self, event):
+        # События — лишь сигнал "перечитай изменения", поэтому при переполнении
+        # новое можно отбросить: клиент всё равно дочитает его вместе с уже ждущими
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+
+class OrderEventHub:
+    """
+    Раздаёт события заказов подписчикам внутри одного процесса.
+
+    publish() вызывается из синхронного кода (после COMMIT) в любом потоке,
+    события доставляются в event loop каждого подписчика.
+    """
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self):
+        subscription = Subscription(asyncio.get_running_loop(), self.maxsize)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # Event loop уже закрыт — клиент ушёл
+                self.unsubscribe(subscription)
+
+
+hub = OrderEventHub()
+
+
+def order_changed(order, created=False):
+    """Публикует событие о заказе, как только текущая транзакция закоммичена"""
+    event = {
+        "type": "created" if created else "updated",
+        "public_code": order.public_code,
+        "status": order.status,
+        "delivery_type": order.delivery_type,
+        "version": order.version,
+    }
+    transaction.on_commit(partial(hub.publish, event))
+
+
+def format_event(event):
+    return f"id: {event['version']}\nevent: order\ndata: {json.dumps(event)}\n\n"
+
+
+async def event_stream(accept=None):
+    """SSE-поток для одного клиента; accept — фильтр событий для роли"""
+    subscription = hub.subscribe()
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if accept is None or accept(event):
+                yield format_event(event)
+    finally:
+        hub.unsubscribe(subscription)
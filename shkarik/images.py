@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+DERIVED_DIR = 'products/derived'
+
+# Форматы производных: WebP для современных браузеров, JPEG — запасной
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+# Ширина карточки меню: половина экрана на телефоне, четверть на ПК
+MENU_IMAGE_SIZES = '(max-width: 699px) 50vw, 25vw'
+
+
+class ImageProcessingError(Exception):
+    """Исходник картинки не прочитать: файла нет или это не картинка"""
+
+
+# ==================== ГЕНЕРАЦИЯ ====================
+
+def _flatten(image):
+    """JPEG не умеет прозрачность — кладём картинку на белый фон"""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_derivatives(source_name):
+    """
+    Нарезает исходник на несколько ширин в WebP и JPEG.
+
+    Имена содержат хеш содержимого исходника, поэтому файлы неизменяемы
+    (их можно кэшировать навсегда), а повторный запуск ничего не пересчитывает.
+    Возвращает описание для Product.image_variants.
+    """
+    with default_storage.open(source_name, 'rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem = posixpath.splitext(posixpath.basename(source_name))[0]
+
+    with Image.open(BytesIO(data)) as original:
+        image = _flatten(ImageOps.exif_transpose(original))
+
+    # Не растягиваем: ширины больше исходника заменяются шириной исходника
+    widths = sorted({min(width, image.width) for width in settings.PRODUCT_IMAGE_WIDTHS})
+    variants = {'source': source_name, 'hash': digest, 'widths': widths}
+
+    for ext, options in FORMATS.items():
+        names = variants[ext] = {}
+        for width in widths:
+            name = f'{DERIVED_DIR}/{stem}-{digest}-{width}.{ext}'
+            if not default_storage.exists(name):
+                height = round(image.height * width / image.width)
+                buffer = BytesIO()
+                image.resize((width, height), Image.LANCZOS).save(buffer, **options)
+                default_storage.save(name, ContentFile(buffer.getvalue()))
+            names[str(width)] = name
+
+    return variants
+
+
+def variant_files(variants):
+    return {name for ext in FORMATS for name in variants.get(ext, {}).values()}
+
+
+def srcset(variants, ext):
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w' for width, name in variants.get(ext, {}).items()
+    )
+
+
+# ==================== ФОНОВАЯ ОБРАБОТКА ====================
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.PRODUCT_IMAGE_WORKERS, thread_name_prefix='product-images'
+            )
+        return _pool
+
+
+def process_product_image(product_id):
+    """
+    Строит производные для блюда и сохраняет их, если картинку не успели сменить.
+    ImageProcessingError — исходник не читается
+    """
+    from .models import Product
+
+    product = Product.objects.filter(pk=product_id).only('image', 'image_variants').first()
+    if product is None or not product.image:
+        return None
+
+    try:
+        variants = build_derivatives(product.image.name)
+    except OSError as exc:
+        raise ImageProcessingError(f'{product.image.name}: {exc}') from exc
+    stale = variant_files(product.image_variants) - variant_files(variants)
+    with transaction.atomic():
+        updated = Product.objects.filter(pk=product_id, image=product.image.name).update(
+            image_variants=variants
+        )
+        if updated:
+            Product.catalog_changed()
+
+    if updated:
+        for name in stale:
+            default_storage.delete(name)
+    return variants
+
+
+def process_in_worker(product_id):
+    # У потока пула своё соединение с БД — не даём ему протухнуть между задачами
+    close_old_connections()
+    try:
+        return process_product_image(product_id)
+    except ImageProcessingError as exc:
+        # Меню продолжит отдавать оригинал
+        logger.warning('Картинка блюда %s не обработана: %s', product_id, exc)
+        raise
+    except Exception:
+        logger.exception('Не удалось обработать картинку блюда %s', product_id)
+        raise
+    finally:
+        close_old_connections()
+
+
+def schedule_product_image(product_id):
+    """
+    Ставит обработку в пул потоков (Pillow отпускает GIL при ресайзе).
+    При PRODUCT_IMAGE_WORKERS = 0 обрабатывает сразу — для тестов и отладки.
+    """
+    if settings.PRODUCT_IMAGE_WORKERS:
+        return _get_pool().submit(process_in_worker, product_id)
+    try:
+        return process_product_image(product_id)
+    except ImageProcessingError as exc:
+        # Сохранение блюда не ломаем — меню продолжит отдавать оригинал
+        logger.warning('Картинка блюда %s не обработана: %s', product_id, exc)
+        return None
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shkarik.archive import ARCHIVE_BATCH, archivable_orders, archive_cutoff, archive_orders
+
+
+class Command(BaseCommand):
+    help = ('Переносит выполненные и отменённые заказы старше N дней в архив (ArchivedOrder) '
+            'короткими транзакциями. Подходит для запуска по cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+                            help='Возраст заказа в днях (по умолчанию ORDER_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch', type=int, default=ARCHIVE_BATCH, help='Заказов в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, ничего не переносить')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = archivable_orders(archive_cutoff(options['days'])).count()
+            self.stdout.write(f"К переносу: {count}")
+            return
+
+        def progress(total):
+            self.stdout.write(f"\r{total}", ending='')
+            self.stdout.flush()
+
+        total = archive_orders(options['days'], options['batch'], progress=progress)
+        if total:
+            self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f"Перенесено в архив: {total}"))
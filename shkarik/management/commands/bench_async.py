@@ -0,0 +1,229 @@
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+
+from shkarik.codes import public_codes
+from shkarik.models import Chef, Courier, Order
+from shkarik.seeding import seed_database, temporary_database
+from shkarik.staff import STAFF_TOKEN_COOKIE, issue_token
+
+from .bench_endpoints import OK_STATUSES, percentile
+
+
+# Кто опрашивает: из каждых 10 клиентов 4 панели повара, 3 курьера и 3 покупателя
+ROLES = ['chef'] * 4 + ['courier'] * 3 + ['customer'] * 3
+
+
+class Poller:
+    """
+    Один открытый экран: панель повара с ?since, панель курьера или
+    страница заказа с If-None-Match. Одинаков для WSGI и ASGI — отличается
+    только клиент, которым идут запросы.
+    """
+
+    def __init__(self, role, tokens, version, secret_code):
+        self.role = role
+        self.token = tokens.get(role)
+        self.version = version
+        self.secret_code = secret_code
+        self.etag = None
+
+    def attach(self, client):
+        if self.token:
+            client.cookies[STAFF_TOKEN_COOKIE] = self.token
+        return client
+
+    def next_request(self):
+        """(путь, параметры, заголовки) очередного опроса"""
+        if self.role == 'chef':
+            return '/api/orders/', {'since': self.version}, {}
+        if self.role == 'courier':
+            return '/api/courier/', {}, {}
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+        return f'/api/order-status/{self.secret_code}/', {}, headers
+
+    def seen(self, response):
+        if self.role == 'chef' and response.status_code == 200:
+            self.version = response.json()['version']
+        elif self.role == 'customer' and response.has_header('ETag'):
+            self.etag = response['ETag']
+
+
+class Command(BaseCommand):
+    help = ('Опрос панелями при большом числе одновременных клиентов: синхронный WSGI '
+            'с пулом потоков против асинхронного ASGI в одном цикле событий')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', default='1,10,50,200',
+                            help='Число одновременных клиентов через запятую')
+        parser.add_argument('--requests', type=int, default=20, help='Опросов от каждого клиента')
+        parser.add_argument('--wsgi-threads', type=int, default=8,
+                            help='Потоков у WSGI-воркера (gunicorn --threads)')
+        parser.add_argument('--slow-ms', type=float, default=20.0,
+                            help='Сколько медленный клиент читает ответ; WSGI держит на это время поток')
+        parser.add_argument('--history', type=int, default=5000, help='Завершённых заказов в БД')
+        parser.add_argument('--active', type=int, default=40, help='Живых заказов в БД')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно для данных')
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(value) for value in options['clients'].split(',')]
+        except ValueError:
+            raise CommandError('--clients: числа через запятую, например 1,10,50')
+        if min(levels) < 1 or options['requests'] < 1 or options['wsgi_threads'] < 1:
+            raise CommandError('Число клиентов, опросов и потоков должно быть положительным')
+
+        bench_settings = override_settings(
+            RATELIMIT_ENABLE=False,   # все клиенты бенчмарка приходят с одного адреса
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        )
+        results = []
+        with temporary_database(), bench_settings:
+            public_codes.reset()
+            cache.clear()
+            seed_database(history=options['history'], active=options['active'], seed=options['seed'])
+            tokens = {
+                'chef': issue_token('chef', Chef.objects.values_list('code', flat=True).first()),
+                'courier': issue_token('courier', Courier.objects.values_list('code', flat=True).first()),
+            }
+            version = self._chef_version(tokens['chef'])
+            tracked = list(Order.objects.order_by('-id').values_list('secret_code', flat=True)[:50])
+
+            for clients in levels:
+                for mode in ('wsgi', 'asgi'):
+                    rng = random.Random(options['seed'])
+                    pollers = [
+                        Poller(ROLES[index % len(ROLES)], tokens, version, rng.choice(tracked))
+                        for index in range(clients)
+                    ]
+                    run = self._run_wsgi if mode == 'wsgi' else self._run_asgi
+                    latencies, errors, elapsed = run(pollers, options)
+                    results.append(self._summary(mode, clients, latencies, errors, elapsed))
+                    self._print_row(results[-1])
+            connection.close()
+            public_codes.reset()
+
+        if options['output']:
+            output = Path(options['output'])
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_text(json.dumps({
+                'options': {key: options[key] for key in
+                            ('clients', 'requests', 'wsgi_threads', 'slow_ms', 'history', 'active', 'seed')},
+                'results': results,
+            }, ensure_ascii=False, indent=2))
+            self.stdout.write(f'Результат: {output}')
+
+    @staticmethod
+    def _chef_version(token):
+        client = Client()
+        client.cookies[STAFF_TOKEN_COOKIE] = token
+        return client.get('/api/orders/').json()['version']
+
+    # ==================== WSGI ====================
+
+    @staticmethod
+    def _run_wsgi(pollers, options):
+        """
+        Воркер с пулом из --wsgi-threads потоков: запрос ждёт свободный поток
+        и держит его, пока медленный клиент не дочитает ответ
+        """
+        workers = threading.Semaphore(options['wsgi_threads'])
+        slow = options['slow_ms'] / 1000
+        start = threading.Event()
+        latencies, errors, lock = [], [0], threading.Lock()
+
+        def client_loop(poller):
+            client = poller.attach(Client())
+            own = []
+            try:
+                start.wait()
+                for _ in range(options['requests']):
+                    path, params, headers = poller.next_request()
+                    started = time.perf_counter()
+                    with workers:
+                        response = client.get(path, params, headers=headers)
+                        time.sleep(slow)
+                    own.append((time.perf_counter() - started) * 1000)
+                    poller.seen(response)
+                    if response.status_code not in OK_STATUSES:
+                        with lock:
+                            errors[0] += 1
+            finally:
+                connection.close()
+                with lock:
+                    latencies.extend(own)
+
+        threads = [threading.Thread(target=client_loop, args=(poller,)) for poller in pollers]
+        for thread in threads:
+            thread.start()
+        started = time.perf_counter()
+        start.set()
+        for thread in threads:
+            thread.join()
+        return latencies, errors[0], time.perf_counter() - started
+
+    # ==================== ASGI ====================
+
+    @staticmethod
+    def _run_asgi(pollers, options):
+        """Все клиенты — задачи одного цикла событий; медленное чтение ответа его не держит"""
+        slow = options['slow_ms'] / 1000
+        latencies, errors = [], [0]
+
+        async def client_loop(poller):
+            client = poller.attach(AsyncClient())
+            for _ in range(options['requests']):
+                path, params, headers = poller.next_request()
+                started = time.perf_counter()
+                response = await client.get(path, params, headers=headers)
+                await asyncio.sleep(slow)
+                latencies.append((time.perf_counter() - started) * 1000)
+                poller.seen(response)
+                if response.status_code not in OK_STATUSES:
+                    errors[0] += 1
+
+        async def main():
+            started = time.perf_counter()
+            await asyncio.gather(*(client_loop(poller) for poller in pollers))
+            return time.perf_counter() - started
+
+        elapsed = asyncio.run(main())
+        return latencies, errors[0], elapsed
+
+    # ==================== ОТЧЁТ ====================
+
+    @staticmethod
+    def _summary(mode, clients, latencies, errors, elapsed):
+        ordered = sorted(latencies)
+        return {
+            'mode': mode,
+            'clients': clients,
+            'requests': len(ordered),
+            'errors': errors,
+            'rps': round(len(ordered) / elapsed, 1),
+            'mean_ms': round(statistics.fmean(ordered), 3),
+            'p50_ms': round(percentile(ordered, 0.50), 3),
+            'p95_ms': round(percentile(ordered, 0.95), 3),
+            'p99_ms': round(percentile(ordered, 0.99), 3),
+        }
+
+    def _print_row(self, row):
+        if not getattr(self, '_header_printed', False):
+            self._header_printed = True
+            self.stdout.write(f"{'режим':<7}{'клиентов':>9}{'запросов':>9}{'ошибок':>8}"
+                              f"{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+        self.stdout.write(
+            f"{row['mode']:<7}{row['clients']:>9}{row['requests']:>9}{row['errors']:>8}"
+            f"{row['rps']:>9}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}"
+        )
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, OperationalError
+
+from shkarik.codes import public_codes
+from shkarik.models import Order, OrderItem
+from shkarik.seeding import temporary_database
+from shkarik.services import create_order_with_items
+
+
+BENCH_CLIENT_NAME = 'Benchmark'
+
+
+def _order_fields(total_price):
+    return {
+        'client_name': BENCH_CLIENT_NAME,
+        'client_phone': '+996700000000',
+        'delivery_type': 'pickup',
+        'total_price': total_price,
+        'status': 'new',
+    }
+
+
+def legacy_writer(cart, total_price):
+    """Старый путь: заказ и каждая позиция — отдельный autocommit"""
+    order = Order.objects.create(**_order_fields(total_price))
+    for item in cart:
+        OrderItem.objects.create(
+            order=order,
+            product_name=item['name'],
+            product_price=item['price'],
+            quantity=item['quantity']
+        )
+    return order
+
+
+def atomic_writer(cart, total_price):
+    """Новый путь: одна транзакция и один INSERT для позиций"""
+    return create_order_with_items(cart, **_order_fields(total_price))
+
+
+WRITERS = {
+    'legacy': legacy_writer,
+    'atomic': atomic_writer,
+}
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность создания заказов (заказов/сек) при конкурентных писателях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Количество параллельных писателей')
+        parser.add_argument('--orders', type=int, default=25, help='Заказов на одного писателя')
+        parser.add_argument('--items', type=int, default=20, help='Позиций в каждом заказе')
+        parser.add_argument('--mode', choices=['legacy', 'atomic', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        cart = [
+            {'name': f'Блюдо {i}', 'price': 100 + i, 'quantity': 1 + i % 3}
+            for i in range(options['items'])
+        ]
+        total_price = sum(item['price'] * item['quantity'] for item in cart)
+
+        modes = ['legacy', 'atomic'] if options['mode'] == 'both' else [options['mode']]
+        results = {}
+        for mode in modes:
+            # Каждый режим — в своей пустой временной БД: рабочая не трогается
+            with temporary_database():
+                public_codes.reset()
+                results[mode] = self._run(WRITERS[mode], cart, total_price, options['writers'], options['orders'])
+                public_codes.reset()
+            self.stdout.write(
+                f"{mode:>7}: {results[mode]['created']} заказов за {results[mode]['elapsed']:.2f} с — "
+                f"{results[mode]['rate']:.1f} заказов/сек, ошибок блокировки: {results[mode]['errors']}"
+            )
+
+        if len(results) == 2 and results['legacy']['rate']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Ускорение: x{results['atomic']['rate'] / results['legacy']['rate']:.2f}"
+            ))
+
+    def _run(self, writer, cart, total_price, writers, orders_per_writer):
+        created = []
+        errors = []
+        lock = threading.Lock()
+        start_barrier = threading.Barrier(writers)
+
+        def work():
+            done = 0
+            failed = 0
+            try:
+                start_barrier.wait()
+                for _ in range(orders_per_writer):
+                    try:
+                        writer(cart, total_price)
+                        done += 1
+                    except OperationalError:
+                        failed += 1
+            finally:
+                connection.close()
+            with lock:
+                created.append(done)
+                errors.append(failed)
+
+        threads = [threading.Thread(target=work) for _ in range(writers)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'created': sum(created),
+            'elapsed': elapsed,
+            'rate': sum(created) / elapsed if elapsed else 0,
+            'errors': sum(errors),
+        }
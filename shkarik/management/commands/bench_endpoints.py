@@ -0,0 +1,250 @@
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from shkarik.codes import public_codes
+from shkarik.models import Chef, Courier, Order
+from shkarik.seeding import MENU, seed_database, temporary_database
+from shkarik.staff import STAFF_TOKEN_COOKIE, issue_token
+
+
+# Доля каждого сценария в смеси запросов (веса)
+MIX = {
+    'home': 20,
+    'create_order': 5,
+    'order_status': 15,
+    'chef_poll': 25,
+    'chef_snapshot': 3,
+    'courier_poll': 15,
+    'update_status': 5,
+    'dashboard': 2,
+}
+
+OK_STATUSES = {200, 204, 304}
+
+
+def percentile(sorted_values, fraction):
+    """Процентиль по ближайшему рангу"""
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Scenario:
+    """Клиенты всех ролей, которые ходят по эндпоинтам как настоящие панели"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.customer = Client()
+        self.chef = Client()
+        self.courier = Client()
+        self.owner = Client()
+
+        chef_code = Chef.objects.values_list('code', flat=True).first()
+        self.courier_code = Courier.objects.values_list('code', flat=True).first()
+        self.chef.cookies[STAFF_TOKEN_COOKIE] = issue_token('chef', chef_code)
+        self.courier.cookies[STAFF_TOKEN_COOKIE] = issue_token('courier', self.courier_code)
+        self.owner.force_login(User.objects.create_superuser('bench-owner', password='x'))
+
+        self.chef_version = self.chef.get('/api/orders/').json()['version']
+        self.tracked = list(Order.objects.order_by('-id').values_list('secret_code', flat=True)[:50])
+        self.etags = {}
+        self.last_ms = 0.0
+
+    def call(self, method, *args, **kwargs):
+        """Сам запрос; подготовка сценария (выбор заказа и т.п.) в замер не входит"""
+        started = time.perf_counter()
+        response = method(*args, **kwargs)
+        self.last_ms = (time.perf_counter() - started) * 1000
+        return response
+
+    def home(self):
+        return self.call(self.customer.get, '/')
+
+    def create_order(self):
+        cart = [
+            {'name': name, 'price': price, 'quantity': self.rng.randint(1, 3)}
+            for name, price in self.rng.sample(MENU, self.rng.randint(1, 4))
+        ]
+        delivery = self.rng.random() < 0.4
+        response = self.call(self.customer.post, '/create-order/', json.dumps({
+            'client_name': 'Нагрузка',
+            'client_phone': '+996700123456',
+            'delivery_type': 'delivery' if delivery else 'pickup',
+            'address': 'ул. Ленина, 1' if delivery else '',
+            'cart': cart,
+        }), content_type='application/json')
+        if response.status_code == 200:
+            self.tracked.append(response.json()['secret_code'])
+        return response
+
+    def order_status(self):
+        secret_code = self.rng.choice(self.tracked)
+        headers = {'HTTP_IF_NONE_MATCH': self.etags[secret_code]} if secret_code in self.etags else {}
+        response = self.call(self.customer.get, f'/api/order-status/{secret_code}/', **headers)
+        if response.has_header('ETag'):
+            self.etags[secret_code] = response['ETag']
+        return response
+
+    def chef_poll(self):
+        response = self.call(self.chef.get, '/api/orders/', {'since': self.chef_version})
+        if response.status_code == 200:
+            self.chef_version = response.json()['version']
+        return response
+
+    def chef_snapshot(self):
+        return self.call(self.chef.get, '/api/orders/')
+
+    def courier_poll(self):
+        return self.call(self.courier.get, '/api/courier/')
+
+    def update_status(self):
+        # Двигаем самый старый живой заказ на шаг вперёд — как повар и курьер
+        order = (Order.objects.filter(status__in=['new', 'cooking', 'ready', 'delivering'])
+                 .order_by('id').values('public_code', 'status', 'delivery_type').first())
+        if order is None:
+            return self.create_order()
+
+        if order['status'] == 'ready' and order['delivery_type'] == 'delivery':
+            client, data = self.courier, {'status': 'delivering', 'accepted_by': self.courier_code}
+        elif order['status'] == 'delivering':
+            client, data = self.courier, {'status': 'completed', 'accepted_by': self.courier_code}
+        else:
+            following = {'new': 'cooking', 'cooking': 'ready', 'ready': 'completed'}[order['status']]
+            client, data = self.chef, {'status': following}
+
+        return self.call(client.post, '/api/update/', json.dumps({'public_code': order['public_code'], **data}),
+                         content_type='application/json')
+
+    def dashboard(self):
+        return self.call(self.owner.get, '/xjf8k2n9s/')
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон всех эндпоинтов в процессе на наполненной БД: '
+            'пропускная способность и задержки p50/p95/p99, результат в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history', type=int, default=5000, help='Завершённых заказов в БД')
+        parser.add_argument('--active', type=int, default=40, help='Живых заказов в БД')
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов в смеси')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно для данных и порядка запросов')
+        parser.add_argument('--output', help='Куда сохранить JSON (по умолчанию bench-results/<время>.json)')
+        parser.add_argument('--compare', help='JSON прошлого прогона — показать изменение p95')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        names = list(MIX)
+        plan = rng.choices(names, weights=[MIX[name] for name in names], k=options['requests'])
+
+        bench_settings = override_settings(
+            RATELIMIT_ENABLE=False,   # все клиенты бенчмарка приходят с одного адреса
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        )
+        with temporary_database(), bench_settings:
+            public_codes.reset()
+            cache.clear()
+            seed_database(history=options['history'], active=options['active'], seed=options['seed'])
+            scenario = Scenario(rng)
+
+            latencies = {name: [] for name in names}
+            errors = {name: 0 for name in names}
+            started = time.perf_counter()
+            for name in plan:
+                response = getattr(scenario, name)()
+                latencies[name].append(scenario.last_ms)
+                if response.status_code not in OK_STATUSES:
+                    errors[name] += 1
+            elapsed = time.perf_counter() - started
+            public_codes.reset()
+
+        report = {
+            'meta': self._meta(options),
+            'total': {
+                'requests': len(plan),
+                'elapsed_s': round(elapsed, 3),
+                'rps': round(len(plan) / elapsed, 1),
+            },
+            'endpoints': {
+                name: self._summary(values, errors[name]) for name, values in latencies.items() if values
+            },
+        }
+
+        self._print(report)
+        output = Path(options['output'] or Path('bench-results') / f"{datetime.now():%Y%m%d-%H%M%S}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+        self.stdout.write(f"Результат: {output}")
+
+        if options['compare']:
+            self._compare(report, options['compare'])
+
+    @staticmethod
+    def _summary(values, errors):
+        ordered = sorted(values)
+        return {
+            'count': len(values),
+            'errors': errors,
+            # Сколько таких запросов в секунду выдержит один воркер
+            'rps': round(1000 / statistics.fmean(values), 1),
+            'mean_ms': round(statistics.fmean(values), 3),
+            'p50_ms': round(percentile(ordered, 0.50), 3),
+            'p95_ms': round(percentile(ordered, 0.95), 3),
+            'p99_ms': round(percentile(ordered, 0.99), 3),
+        }
+
+    @staticmethod
+    def _meta(options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR
+            ).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'history': options['history'],
+            'active': options['active'],
+            'requests': options['requests'],
+            'seed': options['seed'],
+            'mix': MIX,
+        }
+
+    def _print(self, report):
+        self.stdout.write(f"{'эндпоинт':<15}{'запросов':>9}{'ошибок':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for name, row in report['endpoints'].items():
+            self.stdout.write(
+                f"{name:<15}{row['count']:>9}{row['errors']:>8}{row['rps']:>9}"
+                f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}"
+            )
+        total = report['total']
+        self.stdout.write(f"Всего: {total['requests']} запросов за {total['elapsed_s']} с — {total['rps']} запросов/сек")
+
+    def _compare(self, report, path):
+        try:
+            previous = json.loads(Path(path).read_text())
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Не удалось прочитать {path}: {exc}")
+
+        self.stdout.write(f"Изменение p95 относительно {previous['meta'].get('commit') or path}:")
+        for name, row in report['endpoints'].items():
+            before = previous['endpoints'].get(name)
+            if not before or not before['p95_ms']:
+                continue
+            change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+            style = self.style.ERROR if change > 10 else self.style.SUCCESS if change < -10 else str
+            self.stdout.write(style(f"  {name:<15}{before['p95_ms']:>9} → {row['p95_ms']:<9} ({change:+.0f}%)"))
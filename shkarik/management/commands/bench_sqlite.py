@@ -0,0 +1,115 @@
+import json
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from shkarik.codes import public_codes
+from shkarik.models import DailySales, Order
+from shkarik.seeding import temporary_database, use_database
+from shkarik.services import create_order_with_items
+
+
+# Как SQLite ведёт себя без настройки: журнал отката, BEGIN DEFERRED, таймаут 5 с
+DEFAULT_OPTIONS = {}
+
+CART = [
+    {'name': 'Шаурма', 'price': 150, 'quantity': 2},
+    {'name': 'Кофе', 'price': 50, 'quantity': 1},
+]
+
+
+def _worker(path, options, orders, reads, barrier, results):
+    """
+    Один процесс-воркер: создаёт заказы, проводит их до "Выполнен"
+    и между записями читает то, что читает дашборд.
+    """
+    use_database(path, options)
+    public_codes.reset()   # блок кодов, унаследованный через fork, не должен повторяться
+
+    done = locked = 0
+    barrier.wait()
+    for _ in range(orders):
+        try:
+            order = create_order_with_items(
+                CART, client_name='Нагрузка', client_phone='+996700000000',
+                delivery_type='pickup', total_price=350,
+            )
+            for status in ('cooking', 'completed'):
+                order.status = status
+                order.save()
+            for _ in range(reads):
+                list(DailySales.objects.all())
+                Order.objects.filter(status__in=['new', 'cooking']).count()
+            done += 1
+        except OperationalError as exc:
+            if 'locked' not in str(exc):
+                raise
+            locked += 1
+    connection.close()
+    results.put((done, locked))
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест SQLite несколькими процессами: заказы в секунду и ошибки '
+            '"database is locked" без настройки и с настройками из settings.DATABASES')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Количество процессов')
+        parser.add_argument('--orders', type=int, default=50, help='Заказов на один процесс')
+        parser.add_argument('--reads', type=int, default=3, help='Чтений дашборда на один заказ')
+        parser.add_argument('--mode', choices=['default', 'tuned', 'both'], default='both')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        tuned = settings.DATABASES['default'].get('OPTIONS', {})
+        modes = {'default': DEFAULT_OPTIONS, 'tuned': tuned}
+        if options['mode'] != 'both':
+            modes = {options['mode']: modes[options['mode']]}
+
+        results = {}
+        for mode, db_options in modes.items():
+            results[mode] = self._run(db_options, options['workers'], options['orders'], options['reads'])
+            if not options['json']:
+                result = results[mode]
+                self.stdout.write(
+                    f"{mode:>7}: {result['orders']} заказов за {result['elapsed']:.2f} с — "
+                    f"{result['rate']:.1f} заказов/сек, ошибок блокировки: {result['locked']}"
+                )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        elif len(results) == 2 and results['default']['rate']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Ускорение: x{results['tuned']['rate'] / results['default']['rate']:.2f}"
+            ))
+
+    def _run(self, db_options, workers, orders, reads):
+        with temporary_database(db_options) as path:
+            connection.close()   # дочерние процессы откроют свои соединения
+
+            context = multiprocessing.get_context('fork')
+            barrier = context.Barrier(workers + 1)
+            queue = context.Queue()
+            processes = [
+                context.Process(target=_worker, args=(path, db_options, orders, reads, barrier, queue))
+                for _ in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            barrier.wait()
+            started = time.perf_counter()
+            counts = [queue.get() for _ in processes]
+            elapsed = time.perf_counter() - started
+            for process in processes:
+                process.join()
+
+        done = sum(count[0] for count in counts)
+        return {
+            'orders': done,
+            'locked': sum(count[1] for count in counts),
+            'elapsed': elapsed,
+            'rate': done / elapsed if elapsed else 0,
+        }
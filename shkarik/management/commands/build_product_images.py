@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shkarik.images import process_in_worker, process_product_image
+from shkarik.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Готовит уменьшенные копии (WebP + JPEG) картинок блюд, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Обработать все блюда (например, после смены PRODUCT_IMAGE_WIDTHS)')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Сколько картинок обрабатывать параллельно; 0 — по очереди в этом потоке')
+
+    def handle(self, *args, **options):
+        products = [
+            product for product in Product.objects.exclude(image='').only('image', 'image_variants')
+            if options['all'] or not product.image_ready
+        ]
+        if not products:
+            self.stdout.write(self.style.SUCCESS('Все картинки уже обработаны'))
+            return
+
+        if options['workers']:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                futures = {pool.submit(process_in_worker, product.pk): product for product in products}
+                results = [(futures[future], future.exception()) for future in as_completed(futures)]
+        else:
+            results = [(product, self.process(product)) for product in products]
+
+        failed = [(product, error) for product, error in results if error]
+        for product, error in results:
+            if not error:
+                self.stdout.write(f"{product.pk} {product.image.name}")
+
+        if failed:
+            self.stderr.write('Не обработаны:')
+            for product, error in failed:
+                self.stderr.write(f"  {product.pk} {product.image.name}: {error}")
+
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(style(f"Обработано: {len(products) - len(failed)}, с ошибками: {len(failed)}"))
+        if failed:
+            raise CommandError(f'Не удалось обработать картинок: {len(failed)}')
+
+    @staticmethod
+    def process(product):
+        try:
+            process_product_image(product.pk)
+        except Exception as exc:
+            return exc
+        return None
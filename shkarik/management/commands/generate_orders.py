@@ -0,0 +1,43 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shkarik.seeding import PRESETS, seed_database
+
+
+class Command(BaseCommand):
+    help = ('Наполняет пустую БД синтетическими заказами: пики в обед и вечером, доставка и самовывоз, '
+            'курьеры, статусы. Одинаковые пресет, --seed и --end дают одинаковые данные')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=PRESETS, default='small', help='Готовый объём данных')
+        parser.add_argument('--orders', type=int, help='Завершённых заказов (вместо значения пресета)')
+        parser.add_argument('--active', type=int, help='Живых заказов')
+        parser.add_argument('--days', type=int, help='За сколько дней история')
+        parser.add_argument('--couriers', type=int, help='Курьеров')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора')
+        parser.add_argument('--end', type=date.fromisoformat,
+                            help='Последний день истории, YYYY-MM-DD (по умолчанию сегодня)')
+
+    def handle(self, *args, **options):
+        params = dict(PRESETS[options['preset']])
+        for option, param in (('orders', 'history'), ('active', 'active'), ('days', 'days'), ('couriers', 'couriers')):
+            if options[option] is not None:
+                params[param] = options[option]
+
+        def progress(done, total):
+            self.stdout.write(f"\r{done}/{total}", ending='')
+            self.stdout.flush()
+
+        started = time.perf_counter()
+        try:
+            total = seed_database(**params, seed=options['seed'], end=options['end'], progress=progress)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано заказов: {total} за {elapsed:.1f} с ({total / elapsed:.0f} заказов/сек)"
+        ))
@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shkarik.rollups import diff_rollups, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает агрегаты продаж по сырым заказам (или только сверяет их с --verify)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=date.fromisoformat, help='Первый день, YYYY-MM-DD')
+        parser.add_argument('--to', dest='end', type=date.fromisoformat, help='Последний день, YYYY-MM-DD')
+        parser.add_argument('--verify', action='store_true', help='Только сверить, ничего не записывая')
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+
+        if options['verify']:
+            differences = diff_rollups(start, end)
+            for table, key, stored, expected in differences:
+                self.stdout.write(f"{table} {key}: в агрегатах {stored}, по заказам {expected}")
+            if differences:
+                raise CommandError(f"Расхождений: {len(differences)}")
+            self.stdout.write(self.style.SUCCESS('Агрегаты совпадают с заказами'))
+            return
+
+        days, hours, dishes = rebuild_rollups(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересчитано: дней {days}, часовых строк {hours}, строк по блюдам {dishes}"
+        ))
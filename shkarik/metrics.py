@@ -0,0 +1,249 @@
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger(__name__)
+
+# Раз в столько секунд процесс сбрасывает накопленное в общий файл
+FLUSH_EVERY = 5.0
+
+# Метрика → (справка, границы корзин). Память на один view и метод фиксирована:
+# len(границ) + 1 счётчиков и сумма на каждую метрику
+HISTOGRAMS = {
+    'request_duration_seconds': (
+        'Время обработки запроса',
+        (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    ),
+    'db_duration_seconds': (
+        'Время SQL-запросов за один запрос',
+        (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+    ),
+    'db_queries': (
+        'Число SQL-запросов за один запрос',
+        (0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+    ),
+    'response_size_bytes': (
+        'Размер тела ответа',
+        (256, 1024, 4096, 16384, 65536, 262144, 1048576),
+    ),
+}
+
+# Номер строки с суммой значений; строки 0..len(границ) — счётчики корзин
+SUM_SLOT = -1
+
+
+# ==================== УЧЁТ SQL ====================
+# Одна обёртка на каждом соединении; считает только внутри запроса,
+# для которого middleware положила в контекст свой счётчик
+
+class QueryStats:
+    __slots__ = ('count', 'seconds', 'request')
+
+    def __init__(self, request=None):
+        self.count = 0
+        self.seconds = 0.0
+        self.request = request
+
+
+current_stats = ContextVar('shkarik_query_stats', default=None)
+
+
+def track_queries(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.seconds += time.perf_counter() - started
+        stats.count += 1
+
+
+def install_query_tracking(sender, connection, **kwargs):
+    # connection_created приходит при каждом переподключении того же объекта
+    if track_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(track_queries)
+
+
+connection_created.connect(install_query_tracking)
+
+
+# ==================== ГИСТОГРАММЫ ====================
+
+UPSERT_SQL = '''
+    INSERT INTO samples (view, method, metric, slot, value) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (view, method, metric, slot) DO UPDATE SET value = value + excluded.value
+'''
+
+
+class MetricsStore:
+    """
+    Гистограммы запросов, общие для всех воркеров на машине.
+
+    Каждый процесс копит приращения в памяти, а фоновый поток раз в
+    FLUSH_EVERY секунд дописывает их в файл SQLite (WAL) одной транзакцией.
+    Запрос платит только за запись в словарь под блокировкой; ожидание
+    блокировки файла не попадает ни в запрос, ни в цикл событий ASGI.
+    Отдаёт суммы всех процессов.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        self.path = str(path)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pending = {}
+        self._pid = None
+        self._stopped = threading.Event()
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS samples ('
+                ' view TEXT NOT NULL, method TEXT NOT NULL, metric TEXT NOT NULL,'
+                ' slot INTEGER NOT NULL, value REAL NOT NULL,'
+                ' PRIMARY KEY (view, method, metric, slot)'
+                ') WITHOUT ROWID'
+            )
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    def record(self, view, method, **values):
+        """record('home', 'GET', request_duration_seconds=0.003, db_queries=2, ...)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Первая запись процесса или первая после fork: приращения родителя
+                # принадлежат ему, а его поток сброса в дочерний процесс не переходит
+                self._pending, self._pid = {}, os.getpid()
+                threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+            for metric, value in values.items():
+                key = (view, method, metric)
+                row = self._pending.get(key)
+                if row is None:
+                    row = self._pending[key] = [0] * (len(HISTOGRAMS[metric][1]) + 1) + [0.0]
+                row[bisect_left(HISTOGRAMS[metric][1], value)] += 1
+                row[SUM_SLOT] += value
+
+    def _flush_loop(self):
+        while not self._stopped.wait(FLUSH_EVERY):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Сбой фонового сброса метрик')
+
+    def close(self):
+        """Останавливает фоновый сброс и дописывает накопленное"""
+        self._stopped.set()
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        rows = [
+            (view, method, metric, slot if slot != len(row) - 1 else SUM_SLOT, value)
+            for (view, method, metric), row in pending.items()
+            for slot, value in enumerate(row) if value
+        ]
+        try:
+            connection = self._connection()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany(UPSERT_SQL, rows)
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+        except sqlite3.Error:
+            logger.warning('Метрики не записаны, повторим при следующем сбросе', exc_info=True)
+            with self._lock:
+                for key, row in pending.items():
+                    current = self._pending.setdefault(key, [0] * (len(row) - 1) + [0.0])
+                    for slot, value in enumerate(row):
+                        current[slot] += value
+
+    def snapshot(self):
+        """{(view, method, metric): [счётчики корзин..., сумма]} по всем процессам"""
+        self.flush()
+        result = {}
+        for view, method, metric, slot, value in self._connection().execute(
+            'SELECT view, method, metric, slot, value FROM samples'
+        ):
+            if metric not in HISTOGRAMS:
+                continue
+            row = result.setdefault(
+                (view, method, metric), [0] * (len(HISTOGRAMS[metric][1]) + 1) + [0.0]
+            )
+            row[slot] = value
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._pending = {}
+        self._connection().execute('DELETE FROM samples')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != str(settings.METRICS_DB):
+            if _store is not None:
+                _store.close()
+            _store = MetricsStore(settings.METRICS_DB)
+        return _store
+
+
+@atexit.register
+def _flush_on_exit():
+    if _store is not None:
+        _store.flush()
+
+
+# ==================== ФОРМАТ PROMETHEUS ====================
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _label(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def render_prometheus(snapshot, prefix='shkarik_'):
+    lines = []
+    for metric, (help_text, bounds) in HISTOGRAMS.items():
+        name = prefix + metric
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for (view, method, row_metric), row in sorted(snapshot.items()):
+            if row_metric != metric:
+                continue
+            labels = f'view="{_label(view)}",method="{_label(method)}"'
+            cumulative = 0
+            for bound, count in zip((*bounds, '+Inf'), row):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {_number(cumulative)}')
+            lines.append(f'{name}_sum{{{labels}}} {_number(row[SUM_SLOT])}')
+            lines.append(f'{name}_count{{{labels}}} {_number(cumulative)}')
+    return '\n'.join(lines) + '\n'
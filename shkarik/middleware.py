@@ -0,0 +1,77 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import empty
+
+from .metrics import QueryStats, current_stats, get_store
+
+
+def _is_staff(request):
+    """Сотрудник по токену или админ; пользователя из сессии ради этого не загружаем"""
+    if getattr(request, 'staff', None) is not None:
+        return True
+    user = getattr(request, 'user', None)
+    wrapped = getattr(user, '_wrapped', empty)
+    return wrapped is not empty and wrapped.is_staff
+
+
+class RequestTimingMiddleware:
+    """
+    Замеряет каждый запрос: полное время, время и число SQL-запросов, размер
+    ответа — в гистограммы по имени URL и методу (см. metrics.py).
+    Сотрудникам отдаёт то же самое в заголовке Server-Timing.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, started = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self._finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats, token, started = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self._finish(request, response, stats, started)
+
+    @staticmethod
+    def _start(request):
+        stats = QueryStats(request)
+        return stats, current_stats.set(stats), time.perf_counter()
+
+    @staticmethod
+    def _finish(request, response, stats, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else '<unmatched>'
+
+        values = {
+            'request_duration_seconds': elapsed,
+            'db_duration_seconds': stats.seconds,
+            'db_queries': stats.count,
+        }
+        # У потокового ответа (SSE) размер заранее неизвестен
+        if not response.streaming:
+            values['response_size_bytes'] = len(response.content)
+        get_store().record(view, request.method, **values)
+
+        if _is_staff(request):
+            response['Server-Timing'] = (
+                f'app;dur={elapsed * 1000:.1f}, '
+                f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"'
+            )
+        return response
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shkarik', '0013_codesequence'),
+    ]
+
+    operations = [
+        migrations.RenameModel(
+            old_name='CodeSequence',
+            new_name='Sequence',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='version',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shkarik', '0014_rename_codesequence_sequence_order_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('orders', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('cancelled', models.IntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyDishSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('product_name', models.CharField(max_length=200)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('date', 'product_name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyOrders',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.SmallIntegerField()),
+                ('orders', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('date', 'hour')},
+            },
+        ),
+    ]
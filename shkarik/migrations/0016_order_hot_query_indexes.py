@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shkarik', '0015_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('accepted_by__isnull', False)), fields=['accepted_by'], name='order_accepted_by_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def codes_to_couriers(apps, schema_editor):
+    Courier = apps.get_model('shkarik', 'Courier')
+    Order = apps.get_model('shkarik', 'Order')
+    # Одно UPDATE на курьера; коды без курьера (удалённые) остаются пустыми
+    for courier_id, code in Courier.objects.values_list('id', 'code'):
+        Order.objects.filter(accepted_by=code).update(accepted_courier=courier_id)
+
+
+def couriers_to_codes(apps, schema_editor):
+    Courier = apps.get_model('shkarik', 'Courier')
+    Order = apps.get_model('shkarik', 'Order')
+    for courier_id, code in Courier.objects.values_list('id', 'code'):
+        Order.objects.filter(accepted_courier=courier_id).update(accepted_by=code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shkarik', '0016_order_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='accepted_courier',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='shkarik.courier', verbose_name='Курьер'),
+        ),
+        migrations.RunPython(codes_to_couriers, couriers_to_codes),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_accepted_by_idx',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='accepted_by',
+        ),
+        migrations.RenameField(
+            model_name='order',
+            old_name='accepted_courier',
+            new_name='accepted_by',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('accepted_by__isnull', False)), fields=['accepted_by'], name='order_accepted_by_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shkarik', '0018_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('secret_code', models.CharField(max_length=50, unique=True)),
+                ('public_code', models.CharField(max_length=10)),
+                ('client_name', models.CharField(max_length=100)),
+                ('client_phone', models.CharField(max_length=20)),
+                ('delivery_type', models.CharField(choices=[('pickup', 'Самовывоз'), ('delivery', 'Доставка')], max_length=20)),
+                ('address', models.TextField(blank=True)),
+                ('scheduled_time', models.CharField(blank=True, max_length=50)),
+                ('comment', models.TextField(blank=True)),
+                ('total_price', models.IntegerField()),
+                ('status', models.CharField(choices=[('new', 'В очереди'), ('cooking', 'Готовится'), ('ready', 'Готов'), ('delivering', 'Доставляется'), ('completed', 'Выполнен'), ('cancelled', 'Отменен')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('version', models.BigIntegerField()),
+                ('items', models.JSONField(default=list)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('accepted_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_orders', to='shkarik.courier', verbose_name='Курьер')),
+            ],
+            options={
+                'verbose_name': 'Архивный заказ',
+                'verbose_name_plural': 'Архив заказов',
+                'indexes': [models.Index(fields=['created_at'], name='archived_order_created_idx')],
+            },
+        ),
+    ]
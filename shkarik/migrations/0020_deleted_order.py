@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shkarik', '0019_archived_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('public_code', models.CharField(max_length=10)),
+                ('version', models.BigIntegerField(db_index=True)),
+            ],
+        ),
+    ]
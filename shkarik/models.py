@@ -1,7 +1,24 @@
-from django.db import models
-import random
-import string
-import secrets
+from functools import partial
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+from .caching import refresh_menu_version, refresh_order_status
+from .codes import new_secret_code, public_codes
+from .events import order_changed
+from .images import MENU_IMAGE_SIZES, schedule_product_image, srcset
+from .rollups import TERMINAL_STATUSES, record_status_change
+
+
+# Последовательность, из которой заказы получают версию при каждой записи
+ORDER_VERSION_SEQUENCE = 'order_version'
+
+# Эпоха отзыва токенов персонала: растёт при любом изменении повара или курьера
+STAFF_EPOCH_SEQUENCE = 'staff_epoch'
+
+# Версия каталога: растёт при любом изменении блюда, по ней кэшируется меню
+CATALOG_VERSION_SEQUENCE = 'catalog_version'
 
 class Product(models.Model):
     name = models.CharField(max_length=200)
@@ -9,10 +26,73 @@ class Product(models.Model):
     price = models.IntegerField()
     image = models.ImageField(upload_to='products/')
     available = models.BooleanField(default=True)
+    # Уменьшенные копии картинки (WebP + JPEG), см. images.py; заполняются в фоне
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image = dict(zip(field_names, values)).get('image')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Старые копии остаются до готовности новых: image_ready их уже не примет,
+        # а фоновая задача удалит их файлы после замены
+        image_changed = self.image.name != getattr(self, '_loaded_image', None)
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            self.catalog_changed()
+            if image_changed and self.image:
+                transaction.on_commit(partial(schedule_product_image, self.pk))
+        self._loaded_image = self.image.name
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            self.catalog_changed()
+            return super().delete(*args, **kwargs)
+
+    @staticmethod
+    def catalog_changed():
+        """Сдвигает версию каталога — закэшированное меню перестаёт совпадать"""
+        refresh_menu_version(Sequence.next_value(CATALOG_VERSION_SEQUENCE))
+
+    # Для шаблона меню: пока копий нет, отдаётся оригинал
+
+    @property
+    def image_ready(self):
+        return self.image_variants.get('source') == self.image.name
+
+    @property
+    def image_srcset_webp(self):
+        return srcset(self.image_variants, 'webp')
+
+    @property
+    def image_srcset_jpeg(self):
+        return srcset(self.image_variants, 'jpeg')
+
+    @property
+    def image_fallback_url(self):
+        """Средняя JPEG-копия для браузеров без srcset"""
+        names = list(self.image_variants['jpeg'].values())
+        return default_storage.url(names[len(names) // 2])
+
+    image_sizes = MENU_IMAGE_SIZES
+
+
+# Статус не загружался из БД (отложенное поле) — см. Order.from_db
+STATUS_NOT_LOADED = object()
+
+
+class OrderQuerySet(models.QuerySet):
+    def delete(self):
+        # Массовое удаление (админка, скрипты): живые заказы оставляют след для ?since
+        with transaction.atomic(savepoint=False):
+            DeletedOrder.record(self)
+            return super().delete()
+
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -42,34 +122,82 @@ class Order(models.Model):
     total_price = models.IntegerField()
 
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='new')
-    accepted_by = models.CharField(max_length=50, blank=True, null=True)
+    accepted_by = models.ForeignKey(
+        'Courier', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='orders', verbose_name='Курьер',
+        db_index=False,   # см. частичный order_accepted_by_idx ниже
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
-    
+    version = models.BigIntegerField(default=0, db_index=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Очередь повара, живые заказы дашборда, фильтры админки:
+            # поиск по статусу + дата, затрагивает только строки нужных статусов
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            # Заказы курьера: история, статистика, группировка на дашборде.
+            # Частичный — самовывоз и ещё не принятые заказы в него не попадают
+            models.Index(
+                fields=['accepted_by'], name='order_accepted_by_idx',
+                condition=models.Q(accepted_by__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"Заказ {self.public_code}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Статус на момент загрузки — чтобы при сохранении знать, откуда пришёл заказ.
+        # Отложенный (.only/.defer) статус неизвестен, а не None: None — это новый заказ
+        instance._loaded_status = dict(zip(field_names, values)).get('status', STATUS_NOT_LOADED)
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.secret_code:
             self.secret_code = self.generate_secret_code()
         if not self.public_code:
             self.public_code = self.generate_public_code()
-        super().save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+
+        # Версия берётся в той же транзакции, что и запись заказа:
+        # счётчик заблокирован до COMMIT, поэтому версии идут в порядке коммитов
+        created = self._state.adding
+        old_status = getattr(self, '_loaded_status', None)
+        with transaction.atomic(savepoint=False):
+            if old_status is STATUS_NOT_LOADED:
+                old_status = Order.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+            self.version = Sequence.next_value(ORDER_VERSION_SEQUENCE)
+            super().save(*args, **kwargs)
+            self.record_write(old_status, created=created)
+        self._loaded_status = self.status
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            DeletedOrder.record(Order.objects.filter(pk=self.pk))
+            return super().delete(*args, **kwargs)
+
+    def record_write(self, old_status, created=False):
+        """Агрегаты, событие и кэш статуса после записи заказа — в её транзакции"""
+        if old_status != self.status:
+            record_status_change(self, old_status)
+        order_changed(self, created=created)
+        refresh_order_status(self)
 
     @staticmethod
     def generate_secret_code():
-        while True:
-            token = secrets.token_urlsafe(16)
-            if not Order.objects.filter(secret_code=token).exists():
-                return token
+        return new_secret_code()
 
     @staticmethod
     def generate_public_code():
-        while True:
-            code = '#' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-            if not Order.objects.filter(public_code=code).exists():
-                return code
+        return public_codes.allocate()
 
 
 class OrderItem(models.Model):
@@ -86,6 +214,76 @@ class OrderItem(models.Model):
         return self.product_price * self.quantity
 
 
+class DeletedOrder(models.Model):
+    """
+    След удалённого живого заказа: повар узнаёт о нём из ?since в "removed".
+    Версия — из той же последовательности, что и у заказов
+    """
+    public_code = models.CharField(max_length=10)
+    version = models.BigIntegerField(db_index=True)
+
+    def __str__(self):
+        return f"Заказ {self.public_code} (удалён)"
+
+    @classmethod
+    def record(cls, orders):
+        """Оставляет след для незавершённых заказов из orders; завершённые повару не видны"""
+        codes = list(orders.exclude(status__in=TERMINAL_STATUSES).values_list('public_code', flat=True))
+        if codes:
+            version = Sequence.next_value(ORDER_VERSION_SEQUENCE)
+            cls.objects.bulk_create([cls(public_code=code, version=version) for code in codes])
+
+
+class ArchivedOrder(models.Model):
+    """
+    Выполненный или отменённый заказ, перенесённый из Order (см. archive.py).
+    Позиции хранятся снимком в JSON: [[название, цена, количество], ...]
+    """
+    id = models.BigIntegerField(primary_key=True)   # тот же id, что был у заказа
+    secret_code = models.CharField(max_length=50, unique=True)
+    # Без unique: код освобождён и может достаться новому заказу
+    public_code = models.CharField(max_length=10)
+
+    client_name = models.CharField(max_length=100)
+    client_phone = models.CharField(max_length=20)
+
+    delivery_type = models.CharField(max_length=20, choices=Order.DELIVERY_CHOICES)
+    address = models.TextField(blank=True)
+    scheduled_time = models.CharField(max_length=50, blank=True)
+    comment = models.TextField(blank=True)
+    total_price = models.IntegerField()
+
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    accepted_by = models.ForeignKey(
+        'Courier', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='archived_orders', verbose_name='Курьер',
+    )
+
+    created_at = models.DateTimeField()
+    version = models.BigIntegerField()
+    items = models.JSONField(default=list)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Архивный заказ"
+        verbose_name_plural = "Архив заказов"
+        indexes = [
+            # Пересчёт агрегатов продаж за диапазон дат
+            models.Index(fields=['created_at'], name='archived_order_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Заказ {self.public_code} (архив)"
+
+    @property
+    def item_list(self):
+        """Позиции в виде несохранённых OrderItem — для шаблонов и админки"""
+        return [
+            OrderItem(product_name=name, product_price=price, quantity=quantity)
+            for name, price, quantity in self.items
+        ]
+
+
 class Courier(models.Model):
     """Курьер с уникальным кодом"""
     name = models.CharField(max_length=100, verbose_name="Имя курьера")
@@ -101,6 +299,16 @@ class Courier(models.Model):
         verbose_name = "Курьер"
         verbose_name_plural = "Курьеры"
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            Sequence.next_value(STAFF_EPOCH_SEQUENCE)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            Sequence.next_value(STAFF_EPOCH_SEQUENCE)
+            return super().delete(*args, **kwargs)
+
 
 class Chef(models.Model):
     """Повар с кодом доступа"""
@@ -114,4 +322,95 @@ class Chef(models.Model):
     
     class Meta:
         verbose_name = "Повар"
-        verbose_name_plural = "Повара"
\ No newline at end of file
+        verbose_name_plural = "Повара"
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            Sequence.next_value(STAFF_EPOCH_SEQUENCE)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            Sequence.next_value(STAFF_EPOCH_SEQUENCE)
+            return super().delete(*args, **kwargs)
+
+
+class Sequence(models.Model):
+    """Именованный счётчик в БД: номера публичных кодов, версии заказов"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    @classmethod
+    def reserve(cls, name, size=1):
+        """Резервирует блок [start, end) одним UPDATE"""
+        while True:
+            with transaction.atomic(savepoint=False):
+                if cls.objects.filter(name=name).update(value=F('value') + size):
+                    end = cls.objects.values_list('value', flat=True).get(name=name)
+                    return end - size, end
+
+            # Счётчика ещё нет — создаём; при гонке повторяем UPDATE
+            try:
+                with transaction.atomic():
+                    cls.objects.create(name=name, value=size)
+                return 0, size
+            except IntegrityError:
+                continue
+
+    @classmethod
+    def next_value(cls, name):
+        return cls.reserve(name)[1]
+
+    @classmethod
+    def current(cls, name):
+        return cls.objects.filter(name=name).values_list('value', flat=True).first() or 0
+
+    @classmethod
+    async def acurrent(cls, name):
+        return await cls.objects.filter(name=name).values_list('value', flat=True).afirst() or 0
+
+
+# ==================== АГРЕГАТЫ ПРОДАЖ ====================
+# Заполняются по мере того, как заказы доходят до "Выполнен"/"Отменен"
+# (см. rollups.py); день и час — по дате создания заказа
+
+class DailySales(models.Model):
+    """Итоги дня: выручка и количество завершённых заказов"""
+    date = models.DateField(unique=True)
+    orders = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    cancelled = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date}: {self.revenue} сом"
+
+
+class HourlyOrders(models.Model):
+    """Количество завершённых заказов по часам дня"""
+    date = models.DateField()
+    hour = models.SmallIntegerField()
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'hour')
+
+    def __str__(self):
+        return f"{self.date} {self.hour:02d}:00 — {self.orders}"
+
+
+class DailyDishSales(models.Model):
+    """Продажи блюда за день (только выполненные заказы)"""
+    date = models.DateField()
+    product_name = models.CharField(max_length=200)
+    quantity = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'product_name')
+
+    def __str__(self):
+        return f"{self.date} {self.product_name} x{self.quantity}"
@@ -0,0 +1,170 @@
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django_ratelimit import ALL, UNSAFE
+from django_ratelimit.exceptions import Ratelimited
+
+
+# Раз в столько проверок процесс вычищает счётчики, чьё окно давно прошло
+CLEANUP_EVERY = 1000
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+RATE_RE = re.compile(r'^(\d+)/(\d*)([smhd])$')
+
+
+def parse_rate(rate):
+    """'10/m' → (10, 60), '100/5m' → (100, 300)"""
+    match = RATE_RE.match(rate)
+    if match is None:
+        raise ValueError(f'Неверный формат лимита: {rate!r}')
+    limit, multiplier, unit = match.groups()
+    return int(limit), int(multiplier or 1) * PERIODS[unit]
+
+
+# ==================== СКОЛЬЗЯЩЕЕ ОКНО В SQLITE ====================
+
+# Одна строка на ключ: счётчики текущего и предыдущего окна.
+# Все выражения SET видят старую строку, поэтому сдвиг окна и инкремент
+# происходят одним атомарным UPSERT — без гонок между процессами
+HIT_SQL = '''
+    INSERT INTO hits (key, window, current, previous, expires)
+    VALUES (:key, :window, 1, 0, :expires)
+    ON CONFLICT (key) DO UPDATE SET
+        previous = CASE
+            WHEN excluded.window = window THEN previous
+            WHEN excluded.window = window + 1 THEN current
+            ELSE 0
+        END,
+        current = CASE WHEN excluded.window = window THEN current + 1 ELSE 1 END,
+        window = excluded.window,
+        expires = excluded.expires
+    RETURNING current, previous
+'''
+
+
+class SlidingWindowLimiter:
+    """
+    Счётчик запросов, общий для всех процессов на одной машине.
+
+    Хранится в отдельном файле SQLite в режиме WAL: каждая проверка — один
+    UPSERT по первичному ключу, O(1) независимо от числа запросов в окне.
+    Оценка скользящего окна: previous * (доля предыдущего окна, ещё попадающая
+    в последние period секунд) + current.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        self.path = str(path)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        # Соединение своё у каждого потока и процесса (после fork старое не годится)
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS hits ('
+                ' key TEXT PRIMARY KEY, window INTEGER NOT NULL, current INTEGER NOT NULL,'
+                ' previous INTEGER NOT NULL, expires REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            local.connection, local.pid, local.calls = connection, os.getpid(), 0
+        return local.connection
+
+    def hit(self, key, limit, period, now=None):
+        """Засчитывает запрос; возвращает True, если лимит превышен"""
+        now = time.time() if now is None else now
+        window, offset = divmod(now, period)
+        connection = self._connection()
+
+        current, previous = connection.execute(HIT_SQL, {
+            'key': key, 'window': int(window), 'expires': (window + 2) * period,
+        }).fetchone()
+
+        self._local.calls += 1
+        if self._local.calls % CLEANUP_EVERY == 0:
+            connection.execute('DELETE FROM hits WHERE expires < ?', (now,))
+
+        return previous * (1 - offset / period) + current > limit
+
+    def reset(self):
+        self._connection().execute('DELETE FROM hits')
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None or _limiter.path != str(settings.RATELIMIT_DB):
+            _limiter = SlidingWindowLimiter(settings.RATELIMIT_DB)
+        return _limiter
+
+
+# ==================== ДЕКОРАТОР ====================
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+KEYS = {'ip': client_ip}
+
+
+def ratelimit(key='ip', rate='10/m', method=ALL, block=True):
+    """
+    Замена декоратора django_ratelimit с тем же поведением: request.limited
+    и Ratelimited (403) при block=True, RATELIMIT_ENABLE отключает проверку.
+    Счётчики общие для всех воркеров, а не свои в LocMemCache каждого.
+    Подходит и для async view: проверка уходит в поток.
+    """
+    limit, period = parse_rate(rate)
+    get_key = KEYS[key] if isinstance(key, str) else key
+    methods = None if method == ALL else {m.upper() for m in ([method] if isinstance(method, str) else method)}
+
+    def decorator(view):
+        group = f'{view.__module__}.{view.__qualname__}'
+
+        def check(request):
+            limited = False
+            if settings.RATELIMIT_ENABLE and (methods is None or request.method in methods):
+                try:
+                    limited = get_limiter().hit(f'{group}:{rate}:{get_key(request)}', limit, period)
+                except sqlite3.Error:
+                    # Как и django_ratelimit: без счётчика по умолчанию отказываем
+                    limited = not getattr(settings, 'RATELIMIT_FAIL_OPEN', False)
+
+            request.limited = limited or getattr(request, 'limited', False)
+            if limited and block:
+                raise Ratelimited()
+
+        if iscoroutinefunction(view):
+            # Файл счётчиков может ждать блокировку до timeout — не в цикле событий
+            acheck = sync_to_async(check, thread_sensitive=False)
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                await acheck(request)
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            check(request)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+ratelimit.ALL = ALL
+ratelimit.UNSAFE = UNSAFE
@@ -0,0 +1,242 @@
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+
+
+# Статусы, с которыми заказ попадает в агрегаты продаж
+TERMINAL_STATUSES = ('completed', 'cancelled')
+
+
+# ==================== ИНКРЕМЕНТАЛЬНОЕ ОБНОВЛЕНИЕ ====================
+
+def _bump(model, keys, **deltas):
+    """UPDATE ... SET f = f + delta, а если строки ещё нет — INSERT"""
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    increments = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**keys).update(**increments):
+        return
+
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        model.objects.filter(**keys).update(**increments)
+
+
+def record_status_change(order, old_status):
+    """
+    Переносит вклад заказа в агрегаты при смене статуса.
+
+    Вызывается внутри транзакции записи заказа. Удаление заказа агрегаты
+    не меняет — продажи прошлых дней остаются в истории.
+    """
+    record_status_changes([(order, old_status)])
+
+
+def record_status_changes(changes):
+    """
+    То же для многих заказов сразу: [(заказ, старый статус), ...].
+    Дельты складываются по ключам, так что на день, час и блюдо —
+    один UPDATE, сколько бы заказов пакет ни завершил.
+    """
+    from .models import DailySales, DailyDishSales, HourlyOrders, OrderItem
+
+    daily = defaultdict(Counter)
+    hourly = Counter()
+    completed = {}
+    for order, old_status in changes:
+        if old_status not in TERMINAL_STATUSES and order.status not in TERMINAL_STATUSES:
+            continue
+
+        created = timezone.localtime(order.created_at)
+        day = created.date()
+
+        orders_delta = (order.status in TERMINAL_STATUSES) - (old_status in TERMINAL_STATUSES)
+        completed_delta = (order.status == 'completed') - (old_status == 'completed')
+        cancelled_delta = (order.status == 'cancelled') - (old_status == 'cancelled')
+
+        daily[day].update(
+            orders=orders_delta,
+            completed=completed_delta,
+            cancelled=cancelled_delta,
+            revenue=completed_delta * order.total_price,
+        )
+        hourly[day, created.hour] += orders_delta
+        if completed_delta:
+            completed[order.pk] = (day, completed_delta)
+
+    for day, deltas in daily.items():
+        _bump(DailySales, {'date': day}, **deltas)
+    for (day, hour), delta in hourly.items():
+        _bump(HourlyOrders, {'date': day, 'hour': hour}, orders=delta)
+
+    if completed:
+        dishes = defaultdict(Counter)
+        for order_id, name, price, quantity in (OrderItem.objects.filter(order_id__in=completed)
+                                                .values_list('order_id', 'product_name', 'product_price', 'quantity')):
+            day, delta = completed[order_id]
+            dishes[day, name].update(quantity=delta * quantity, revenue=delta * price * quantity)
+        for (day, name), deltas in dishes.items():
+            _bump(DailyDishSales, {'date': day, 'product_name': name}, **deltas)
+
+
+# ==================== ПЕРЕСЧЁТ ПО СЫРЫМ ЗАКАЗАМ ====================
+
+def _date_range(queryset, field, start, end):
+    if start:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end:
+        queryset = queryset.filter(**{f'{field}__lte': end})
+    return queryset
+
+
+def _order_totals(orders):
+    """Итоги по дням и часам для выборки заказов (Order или ArchivedOrder)"""
+    completed = Q(status='completed')
+
+    daily = {
+        row['day']: {
+            'orders': row['orders'],
+            'completed': row['completed'],
+            'cancelled': row['cancelled'],
+            'revenue': row['revenue'],
+        }
+        for row in (orders
+                    .annotate(day=TruncDate('created_at'))
+                    .values('day')
+                    .annotate(
+                        orders=Count('id'),
+                        completed=Count('id', filter=completed),
+                        cancelled=Count('id', filter=Q(status='cancelled')),
+                        revenue=Sum('total_price', filter=completed, default=0),
+                    ))
+    }
+
+    hourly = {
+        (row['day'], row['hour']): row['orders']
+        for row in (orders
+                    .annotate(day=TruncDate('created_at'), hour=ExtractHour('created_at'))
+                    .values('day', 'hour')
+                    .annotate(orders=Count('id')))
+    }
+
+    return daily, hourly
+
+
+def compute_from_orders(start=None, end=None):
+    """Считает агрегаты за даты [start, end] заново по таблицам заказов и архиву"""
+    from .models import ArchivedOrder, Order, OrderItem
+
+    orders = _date_range(Order.objects.filter(status__in=TERMINAL_STATUSES), 'created_at__date', start, end)
+    daily, hourly = _order_totals(orders)
+
+    items = _date_range(
+        OrderItem.objects.filter(order__status='completed'), 'order__created_at__date', start, end
+    )
+    dishes = {
+        (row['day'], row['product_name']): {'quantity': row['total_qty'], 'revenue': row['total_revenue']}
+        for row in (items
+                    .annotate(day=TruncDate('order__created_at'))
+                    .values('day', 'product_name')
+                    .annotate(
+                        total_qty=Sum('quantity'),
+                        total_revenue=Sum(F('product_price') * F('quantity')),
+                    ))
+    }
+
+    # Архив: дни и часы тем же GROUP BY, блюда — из JSON-снимка позиций
+    archived = _date_range(ArchivedOrder.objects.all(), 'created_at__date', start, end)
+    archived_daily, archived_hourly = _order_totals(archived)
+    for day, row in archived_daily.items():
+        totals = daily.setdefault(day, dict.fromkeys(row, 0))
+        for field, value in row.items():
+            totals[field] += value
+    for key, count in archived_hourly.items():
+        hourly[key] = hourly.get(key, 0) + count
+
+    for created, snapshot in archived.filter(status='completed').values_list('created_at', 'items').iterator():
+        day = timezone.localtime(created).date()
+        for name, price, quantity in snapshot:
+            row = dishes.setdefault((day, name), {'quantity': 0, 'revenue': 0})
+            row['quantity'] += quantity
+            row['revenue'] += price * quantity
+
+    return daily, hourly, dishes
+
+
+def stored_rollups(start=None, end=None):
+    """Текущее содержимое таблиц агрегатов в том же виде, что compute_from_orders"""
+    from .models import DailySales, DailyDishSales, HourlyOrders
+
+    daily = {
+        row.pop('date'): row
+        for row in _date_range(DailySales.objects.all(), 'date', start, end)
+        .values('date', 'orders', 'completed', 'cancelled', 'revenue')
+    }
+    hourly = {
+        (date, hour): orders
+        for date, hour, orders in _date_range(HourlyOrders.objects.all(), 'date', start, end)
+        .values_list('date', 'hour', 'orders')
+    }
+    dishes = {
+        (date, name): {'quantity': quantity, 'revenue': revenue}
+        for date, name, quantity, revenue in _date_range(DailyDishSales.objects.all(), 'date', start, end)
+        .values_list('date', 'product_name', 'quantity', 'revenue')
+    }
+
+    return daily, hourly, dishes
+
+
+def _without_zeros(daily, hourly, dishes):
+    # Строки, обнулившиеся после отмены статуса, равносильны отсутствующим
+    return (
+        {key: row for key, row in daily.items() if any(row.values())},
+        {key: orders for key, orders in hourly.items() if orders},
+        {key: row for key, row in dishes.items() if any(row.values())},
+    )
+
+
+def diff_rollups(start=None, end=None):
+    """Расхождения между таблицами агрегатов и сырыми заказами"""
+    expected = _without_zeros(*compute_from_orders(start, end))
+    actual = _without_zeros(*stored_rollups(start, end))
+
+    differences = []
+    for table, want, have in zip(('daily', 'hourly', 'dishes'), expected, actual):
+        for key in sorted(set(want) | set(have), key=str):
+            if want.get(key) != have.get(key):
+                differences.append((table, key, have.get(key), want.get(key)))
+    return differences
+
+
+@transaction.atomic
+def rebuild_rollups(start=None, end=None):
+    """Перезаписывает агрегаты за даты [start, end] значениями из сырых заказов"""
+    from .models import DailySales, DailyDishSales, HourlyOrders
+
+    daily, hourly, dishes = compute_from_orders(start, end)
+
+    _date_range(DailySales.objects.all(), 'date', start, end).delete()
+    _date_range(HourlyOrders.objects.all(), 'date', start, end).delete()
+    _date_range(DailyDishSales.objects.all(), 'date', start, end).delete()
+
+    DailySales.objects.bulk_create(
+        [DailySales(date=date, **row) for date, row in daily.items()], batch_size=500
+    )
+    HourlyOrders.objects.bulk_create(
+        [HourlyOrders(date=date, hour=hour, orders=orders) for (date, hour), orders in hourly.items()],
+        batch_size=500
+    )
+    DailyDishSales.objects.bulk_create(
+        [DailyDishSales(date=date, product_name=name, **row) for (date, name), row in dishes.items()],
+        batch_size=500
+    )
+
+    return len(daily), len(hourly), len(dishes)
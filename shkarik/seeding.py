@@ -0,0 +1,190 @@
+import itertools
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .codes import encode, public_codes
+from .models import Chef, Courier, Order, OrderItem, Product, Sequence, ORDER_VERSION_SEQUENCE
+from .rollups import rebuild_rollups
+
+
+MENU = [
+    ('Шаурма классическая', 180), ('Шаурма сырная', 210), ('Шаурма XL', 260),
+    ('Донер', 190), ('Бургер', 220), ('Картофель фри', 90), ('Наггетсы', 140),
+    ('Кофе', 80), ('Чай', 40), ('Лимонад', 70), ('Айран', 50), ('Самса', 60),
+]
+
+# Насколько часто блюдо попадает в корзину (в том же порядке, что MENU)
+POPULARITY = [10, 6, 3, 5, 5, 8, 4, 6, 4, 3, 3, 4]
+
+NAMES = ['Арсен', 'Айбек', 'Нурлан', 'Айгуль', 'Бакыт', 'Дана', 'Эрлан', 'Жылдыз']
+
+
+# ==================== ВРЕМЕННАЯ БД ====================
+
+def use_database(path, options):
+    """Переключает соединение этого процесса на другой файл БД"""
+    connection.close()
+    connection.settings_dict['NAME'] = path
+    connection.settings_dict['OPTIONS'] = options
+
+
+@contextmanager
+def temporary_database(options=None):
+    """Пустая БД со всеми миграциями во временном файле; после выхода файл удаляется"""
+    original = connection.settings_dict['NAME'], connection.settings_dict.get('OPTIONS', {})
+    descriptor, path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(descriptor)
+    try:
+        use_database(path, original[1] if options is None else options)
+        call_command('migrate', verbosity=0)
+        yield path
+    finally:
+        use_database(*original)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+# ==================== НАПОЛНЕНИЕ ====================
+
+# Готовые объёмы: одинаковый пресет и seed дают одинаковую БД на любой машине
+PRESETS = {
+    'tiny': {'history': 2_000, 'active': 20, 'days': 30, 'couriers': 3, 'chefs': 1},
+    'small': {'history': 50_000, 'active': 40, 'days': 90, 'couriers': 8, 'chefs': 2},
+    'medium': {'history': 500_000, 'active': 80, 'days': 180, 'couriers': 20, 'chefs': 4},
+    'large': {'history': 2_000_000, 'active': 120, 'days': 365, 'couriers': 40, 'chefs': 6},
+}
+
+# Время заказа: обеденный и вечерний пики плюс ровный фон с 9 до 23
+DAY_PEAKS = [
+    # (доля заказов, середина в часах, разброс в часах)
+    (0.40, 13.0, 1.0),
+    (0.40, 19.5, 1.3),
+]
+OPEN_HOURS = (9, 23)
+
+# В выходные заказов больше (понедельник = 0)
+WEEKDAY_WEIGHTS = [1.0, 1.0, 1.0, 1.05, 1.2, 1.35, 1.3]
+
+DELIVERY_SHARE = 0.4
+CANCELLED_SHARE = 0.08
+ACTIVE_STATUSES = ['new', 'new', 'cooking', 'ready', 'delivering']
+
+BATCH_SIZE = 10_000
+
+
+def _order_hour(rng):
+    """Час дня (дробный) с пиками на обед и ужин"""
+    roll = rng.random()
+    for share, middle, spread in DAY_PEAKS:
+        if roll < share:
+            return min(max(rng.gauss(middle, spread), OPEN_HOURS[0]), OPEN_HOURS[1] - 1e-6)
+        roll -= share
+    return rng.uniform(*OPEN_HOURS)
+
+
+def _history_times(rng, count, days, end):
+    """count моментов за days дней до даты end, по возрастанию"""
+    dates = [end - timedelta(days=offset) for offset in range(days, 0, -1)]
+    picked = rng.choices(dates, weights=[WEEKDAY_WEIGHTS[d.weekday()] for d in dates], k=count)
+    midnights = {d: timezone.make_aware(datetime.combine(d, time.min)) for d in dates}
+    return sorted(midnights[d] + timedelta(hours=_order_hour(rng)) for d in picked)
+
+
+def _insert(model, fields, rows):
+    """
+    Пачка INSERT одним executemany в обход ORM: без auto_now_add
+    (нужна дата из прошлого) и без построения объектов моделей.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})', rows
+        )
+
+
+def seed_database(history=5000, active=40, days=60, couriers=5, chefs=2, seed=0, end=None, progress=None):
+    """
+    Наполняет пустую БД: меню, персонал, history завершённых заказов за days
+    дней до даты end и active живых за час до 21:00 этого дня (без end —
+    до сегодняшнего дня и текущего момента).
+
+    Заказы с позициями пишутся пачками по BATCH_SIZE сырыми INSERT, агрегаты
+    продаж пересчитываются в конце. При одинаковых параметрах и seed данные
+    одинаковы. progress(готово, всего) вызывается после каждой пачки.
+    """
+    if Order.objects.exists():
+        raise ValueError('Наполнять можно только БД без заказов')
+
+    rng = random.Random(seed)
+    if end is None:
+        end, now = timezone.localdate(), timezone.now()
+    else:
+        now = timezone.make_aware(datetime.combine(end, time(21)))
+
+    with transaction.atomic():
+        Product.objects.bulk_create([
+            Product(name=name, description=f'{name} — описание', price=price, image='products/seed.jpg')
+            for name, price in MENU
+        ])
+        staff = Courier.objects.bulk_create([
+            Courier(name=f'Курьер {i + 1}', code=f'courier{i + 1}') for i in range(couriers)
+        ])
+        Chef.objects.bulk_create([Chef(name=f'Повар {i + 1}', code=f'chef{i + 1}') for i in range(chefs)])
+
+    total = history + active
+    courier_ids = [courier.pk for courier in staff]
+    first_version, _ = Sequence.reserve(ORDER_VERSION_SEQUENCE, total)
+    created_times = _history_times(rng, history, days, end)
+    created_times += sorted(now - timedelta(seconds=rng.uniform(0, 3600)) for _ in range(active))
+    adapt = connection.ops.adapt_datetimefield_value
+    cumulative = list(itertools.accumulate(POPULARITY))
+
+    order_fields = [
+        'id', 'secret_code', 'public_code', 'client_name', 'client_phone', 'delivery_type', 'address',
+        'scheduled_time', 'comment', 'total_price', 'status', 'accepted_by', 'created_at', 'version',
+    ]
+    item_fields = ['order', 'product_name', 'product_price', 'quantity']
+
+    for start in range(0, total, BATCH_SIZE):
+        orders, items = [], []
+        for index in range(start, min(start + BATCH_SIZE, total)):
+            order_id = index + 1
+            dishes = set(rng.choices(range(len(MENU)), cum_weights=cumulative, k=rng.randint(1, 4)))
+            cart = [(*MENU[dish], rng.randint(1, 3)) for dish in sorted(dishes)]
+            delivery = rng.random() < DELIVERY_SHARE
+            if index < history:
+                status = 'cancelled' if rng.random() < CANCELLED_SHARE else 'completed'
+                # Архивные коды длиннее живых, поэтому с ними никогда не совпадут
+                public_code = f'#H{encode(index, 6)}'
+            else:
+                status = rng.choice(ACTIVE_STATUSES)
+                public_code = public_codes.allocate()
+            courier = rng.choice(courier_ids) if delivery and status in ('delivering', 'completed') else None
+
+            orders.append((
+                order_id, f'{rng.getrandbits(128):032x}', public_code, rng.choice(NAMES),
+                f'+996700{rng.randint(0, 999999):06d}', 'delivery' if delivery else 'pickup',
+                'ул. Ленина, 1' if delivery else '', '', '',
+                sum(price * quantity for _, price, quantity in cart), status, courier,
+                adapt(created_times[index]), first_version + index + 1,
+            ))
+            items.extend((order_id, name, price, quantity) for name, price, quantity in cart)
+
+        with transaction.atomic():
+            _insert(Order, order_fields, orders)
+            _insert(OrderItem, item_fields, items)
+        if progress:
+            progress(start + len(orders), total)
+
+    rebuild_rollups()
+    return total
@@ -0,0 +1,202 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Case, Value, When
+
+from .caching import refresh_order_status
+from .events import order_changed
+from .models import Order, OrderItem, Sequence, ORDER_VERSION_SEQUENCE
+from .rollups import record_status_changes
+
+
+# Сколько раз пробуем новые коды, если уникальный индекс отклонил вставку
+CODE_ATTEMPTS = 5
+
+
+# ==================== СОЗДАНИЕ ЗАКАЗА ====================
+
+def create_order_with_items(cart, **fields):
+    """Создаёт заказ и все его позиции одной транзакцией"""
+
+    for attempt in range(CODE_ATTEMPTS):
+        # Коды выдаются до транзакции: в SQLite чтение внутри транзакции
+        # с последующей записью приводит к "database is locked" без ожидания
+        order = Order(
+            secret_code=Order.generate_secret_code(),
+            public_code=Order.generate_public_code(),
+            **fields
+        )
+
+        try:
+            with transaction.atomic():
+                order.save(force_insert=True)
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product_name=item['name'][:200],
+                        product_price=int(item['price']),
+                        quantity=int(item['quantity'])
+                    ) for item in cart
+                ])
+            return order
+        except IntegrityError:
+            # Код занят (новый цикл кодов или блок, выданный дважды) — берём следующий
+            if attempt == CODE_ATTEMPTS - 1:
+                raise
+
+
+# ==================== СМЕНА СТАТУСА ====================
+
+# Конечный автомат заказа: из какого статуса в какие можно перейти.
+# Из выполненного и отменённого выхода нет (поправить можно только в админке)
+TRANSITIONS = {
+    'new': ('cooking', 'ready', 'cancelled'),
+    'cooking': ('ready', 'cancelled'),
+    'ready': ('delivering', 'completed', 'cancelled'),
+    'delivering': ('completed', 'cancelled'),
+    'completed': (),
+    'cancelled': (),
+}
+
+# Обратная таблица: из каких статусов можно прийти в данный
+SOURCES = {
+    status: tuple(source for source, targets in TRANSITIONS.items() if status in targets)
+    for status in TRANSITIONS
+}
+
+# Что нужно событию, кэшу статуса и агрегатам после перехода
+TRANSITION_FIELDS = (
+    'id', 'secret_code', 'public_code', 'delivery_type', 'total_price', 'status', 'created_at', 'version',
+)
+
+
+class TransitionConflict(Exception):
+    """Заказ уже не в том статусе, из которого его переводят"""
+
+    def __init__(self, current):
+        super().__init__(current)
+        self.current = current
+
+
+def transition_sources(status, expected=None):
+    """Статусы, из которых допустим переход; ValueError — переход невозможен"""
+    sources = SOURCES.get(status, ())
+    if expected is not None:
+        sources = (expected,) if expected in sources else ()
+    if not sources:
+        raise ValueError(f'Недопустимый переход в {status!r}')
+    return sources
+
+
+def change_status(public_code, status, expected=None, courier=None):
+    """
+    Переводит заказ в status одним условным UPDATE
+    (WHERE public_code = ... AND status IN <допустимые>): из двух курьеров,
+    одновременно взявших заказ, его получает один, второй — TransitionConflict.
+
+    expected — статус, который видел клиент; без него годится любой
+    допустимый. Order.DoesNotExist — заказа нет, ValueError — переход
+    недопустим (в том числе самовывоз курьеру). Версия, агрегаты, событие
+    и кэш статуса обновляются так же, как в Order.save().
+    """
+    sources = transition_sources(status, expected)
+    changes = {'status': status}
+    conditions = {'public_code': public_code, 'status__in': sources}
+    if status == 'delivering':
+        changes['accepted_by'] = courier
+        conditions['delivery_type'] = 'delivery'
+    elif status == 'cancelled':
+        # Выполненный заказ остаётся в истории курьера, отменённый — освобождается
+        changes['accepted_by'] = None
+
+    # Исключение внутри atomic(savepoint=False) откатило бы и внешнюю транзакцию
+    # (пакетную смену статусов) — поэтому проигрыш выясняем внутри, а бросаем снаружи
+    order = current = None
+    with transaction.atomic(savepoint=False):
+        # Номер версии, доставшийся проигравшему, просто пропускается
+        changes['version'] = Sequence.next_value(ORDER_VERSION_SEQUENCE)
+        if Order.objects.filter(**conditions).update(**changes):
+            order = Order.objects.only(*TRANSITION_FIELDS).get(public_code=public_code)
+            # Из конечных статусов переходов нет, так что агрегатам хватает expected (или None)
+            order.record_write(old_status=expected)
+        else:
+            current = Order.objects.filter(public_code=public_code).values_list('status', 'delivery_type').first()
+
+    if order is None:
+        if current is None:
+            raise Order.DoesNotExist(public_code)
+        current_status, delivery_type = current
+        # Тип доставки не меняется — это не гонка, а неверный запрос
+        if status == 'delivering' and delivery_type != 'delivery':
+            raise ValueError('Самовывоз не передаётся курьеру')
+        raise TransitionConflict(current_status)
+    return order
+
+
+# ==================== ПАКЕТНАЯ СМЕНА СТАТУСА ====================
+
+# Статусы, доступные пакетом: курьер берёт заказ только по одному (change_status)
+BATCH_STATUSES = ('cooking', 'ready', 'completed', 'cancelled')
+
+# Больше заказов за раз повар не отмечает; ограничивает и размер IN (...)
+BATCH_LIMIT = 100
+
+
+def change_statuses(entries):
+    """
+    Пакетная смена статусов одной транзакцией.
+
+    entries — [(public_code, expected или None, status), ...]; результат —
+    [(public_code, итог, текущий статус)] в том же порядке, итог: 'ok',
+    'conflict' (заказ уже не в ожидаемом статусе), 'not_found' или 'invalid'.
+
+    Блок версий берётся одним UPDATE счётчика, затем по одному условному
+    UPDATE на каждую пару (expected, status), одно чтение изменённых
+    заказов и агрегаты одним проходом.
+    """
+    results = [None] * len(entries)
+    valid = {}
+    for index, (code, expected, status) in enumerate(entries):
+        if code in valid or status not in BATCH_STATUSES or (expected and expected not in SOURCES[status]):
+            results[index] = (code, 'invalid', None)
+        else:
+            valid[code] = (index, expected or None, status)
+    if not valid:
+        return results
+
+    with transaction.atomic(savepoint=False):
+        start, _ = Sequence.reserve(ORDER_VERSION_SEQUENCE, len(valid))
+        versions = {code: start + offset + 1 for offset, code in enumerate(valid)}
+
+        groups = defaultdict(list)
+        for code, (index, expected, status) in valid.items():
+            groups[expected, status].append(code)
+        for (expected, status), codes in groups.items():
+            changes = {
+                'status': status,
+                'version': Case(*(When(public_code=code, then=Value(versions[code])) for code in codes),
+                                output_field=BigIntegerField()),
+            }
+            if status == 'cancelled':
+                changes['accepted_by'] = None
+            sources = (expected,) if expected else SOURCES[status]
+            Order.objects.filter(public_code__in=codes, status__in=sources).update(**changes)
+
+        # Свою версию у заказа мог оставить только наш UPDATE
+        orders = Order.objects.only(*TRANSITION_FIELDS).in_bulk(list(valid), field_name='public_code')
+        changed = []
+        for code, (index, expected, status) in valid.items():
+            order = orders.get(code)
+            if order is None:
+                results[index] = (code, 'not_found', None)
+            elif order.version == versions[code]:
+                results[index] = (code, 'ok', order.status)
+                changed.append((order, expected))
+            else:
+                results[index] = (code, 'conflict', order.status)
+
+        record_status_changes(changed)
+        for order, _ in changed:
+            order_changed(order)
+            refresh_order_status(order)
+    return results
@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+from .metrics import current_stats
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько разных отпечатков процесс помнит; при переполнении забывается самый дешёвый
+MAX_FINGERPRINTS = 200
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+# Свои обёртки над запросами и тесты (они вызывают view через клиент) источником не считаются
+INTERNAL_FILES = {
+    os.path.join(PACKAGE_DIR, name) for name in ('slowlog.py', 'metrics.py', 'middleware.py', 'tests.py')
+}
+
+
+# ==================== ОТПЕЧАТОК ====================
+
+NORMALIZE = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),                      # строки
+    (re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b'), '?'),          # числа
+    (re.compile(r'%s'), '?'),                                   # параметры
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(...)'),       # IN (?, ?, ...) любой длины
+    (re.compile(r'(?:\(\.\.\.\)|\(\?\))(?:\s*,\s*(?:\(\.\.\.\)|\(\?\)))+'), '(...)'),   # VALUES (...), (...)
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def fingerprint(sql):
+    """SQL без значений: запросы, отличающиеся только параметрами, совпадают"""
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    sql = sql.strip()
+    return hashlib.blake2b(sql.encode(), digest_size=6).hexdigest(), sql
+
+
+def query_origin():
+    """
+    Функция проекта, из которой ушёл запрос: owner_dashboard,
+    CourierAdmin.delivery_history... Если запрос целиком построил Django
+    (например, список в админке) — имя URL текущего запроса.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.startswith(PACKAGE_DIR) and code.co_filename not in INTERNAL_FILES:
+            name = code.co_qualname.replace('.<locals>', '')
+            return re.sub(r'\.<\w+>$', '', name)
+        frame = frame.f_back
+
+    stats = current_stats.get()
+    match = stats and stats.request and stats.request.resolver_match
+    return match.view_name if match else '-'
+
+
+# ==================== ТОП ДОРОГИХ ЗАПРОСОВ ====================
+
+class SlowQueryLog:
+    """Самые дорогие отпечатки процесса по суммарному времени"""
+
+    def __init__(self, capacity=MAX_FINGERPRINTS):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def add(self, sql, seconds, rows, origin):
+        digest, normalized = fingerprint(sql)
+        milliseconds = seconds * 1000
+        logger.warning(
+            'Медленный запрос %.1f мс, строк %s, %s [%s]: %s',
+            milliseconds, '?' if rows is None else rows, origin, digest, normalized[:1000]
+        )
+
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                if len(self._entries) >= self.capacity:
+                    cheapest = min(self._entries, key=lambda key: self._entries[key]['total_ms'])
+                    del self._entries[cheapest]
+                entry = self._entries[digest] = {
+                    'fingerprint': digest, 'sql': normalized, 'count': 0,
+                    'total_ms': 0.0, 'max_ms': 0.0, 'rows': None, 'origins': {},
+                }
+            entry['count'] += 1
+            entry['total_ms'] += milliseconds
+            entry['max_ms'] = max(entry['max_ms'], milliseconds)
+            entry['rows'] = rows
+            entry['last_seen'] = time.time()
+            entry['origins'][origin] = entry['origins'].get(origin, 0) + 1
+
+    def top(self, limit=None):
+        with self._lock:
+            entries = [
+                {**entry, 'mean_ms': entry['total_ms'] / entry['count'], 'origins': dict(entry['origins'])}
+                for entry in self._entries.values()
+            ]
+        entries.sort(key=lambda entry: entry['total_ms'], reverse=True)
+        return entries[:limit or settings.SLOW_QUERY_TOP]
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
+
+
+slow_queries = SlowQueryLog()
+
+
+# ==================== ОБЁРТКА НАД ЗАПРОСАМИ ====================
+
+class RowCountingCursor:
+    """
+    Курсор медленного SELECT: считает выбранные строки и пишет запрос в журнал,
+    когда Django его закроет. Быстрым запросам не достаётся.
+    """
+
+    def __init__(self, cursor, sql, started, origin):
+        self.cursor = cursor
+        self.sql = sql
+        self.started = started
+        self.origin = origin
+        self.rows = 0
+        self.finished = False
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        for row in self.cursor:
+            self.rows += 1
+            yield row
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        self.rows += row is not None
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        self.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.rows += len(rows)
+        return rows
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            slow_queries.add(self.sql, time.perf_counter() - self.started, self.rows, self.origin)
+
+    def close(self):
+        self.finish()
+        return self.cursor.close()
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    wrapper = context['cursor']
+    if isinstance(wrapper.cursor, RowCountingCursor):
+        # Тот же курсор выполняет следующий запрос — прошлый закончен
+        wrapper.cursor.finish()
+        wrapper.cursor = wrapper.cursor.cursor
+
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed = time.perf_counter() - started
+
+    threshold = settings.SLOW_QUERY_MS
+    if threshold is None or elapsed * 1000 < threshold:
+        return result
+
+    origin = query_origin()
+    rowcount = wrapper.cursor.rowcount
+    if rowcount >= 0 or many:
+        slow_queries.add(sql, elapsed, rowcount if rowcount >= 0 else None, origin)
+    else:
+        # SQLite сообщает число строк SELECT только по мере выборки
+        wrapper.cursor = RowCountingCursor(wrapper.cursor, sql, started, origin)
+    return result
+
+
+def install_slow_query_log(sender, connection, **kwargs):
+    if log_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, log_slow_queries)
+
+
+connection_created.connect(install_slow_query_log)
@@ -0,0 +1,143 @@
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core import signing
+
+from .models import Chef, Courier, Sequence, STAFF_EPOCH_SEQUENCE
+
+
+STAFF_TOKEN_COOKIE = 'staff_token'
+STAFF_TOKEN_SALT = 'shkarik.staff'
+
+# Токен живёт час и перевыпускается, если ему больше 15 минут
+STAFF_TOKEN_MAX_AGE = 60 * 60
+STAFF_TOKEN_REFRESH_AFTER = 15 * 60
+
+# Как долго процесс верит прочитанной эпохе отзыва
+EPOCH_CACHE_SECONDS = 5
+
+STAFF_MODELS = {'chef': Chef, 'courier': Courier}
+
+
+class StaffMember:
+    def __init__(self, role, code):
+        self.role = role
+        self.code = code
+
+
+# ==================== ЭПОХА ОТЗЫВА ====================
+# Любое изменение повара или курьера увеличивает эпоху (см. models.py).
+# Токен со старой эпохой проверяется по БД один раз и перевыпускается
+
+_epoch_lock = threading.Lock()
+_epoch = {'value': None, 'checked_at': 0.0}
+
+
+def current_epoch():
+    now = time.monotonic()
+    with _epoch_lock:
+        if _epoch['value'] is not None and now - _epoch['checked_at'] < EPOCH_CACHE_SECONDS:
+            return _epoch['value']
+    value = Sequence.current(STAFF_EPOCH_SEQUENCE)
+    with _epoch_lock:
+        _epoch['value'], _epoch['checked_at'] = value, now
+    return value
+
+
+def reset_epoch_cache():
+    with _epoch_lock:
+        _epoch['value'] = None
+
+
+# ==================== ТОКЕН ====================
+
+def issue_token(role, code):
+    return signing.dumps(
+        {'r': role, 'c': code, 'e': current_epoch(), 'i': int(time.time())},
+        salt=STAFF_TOKEN_SALT
+    )
+
+
+def set_token_cookie(response, request, role, code):
+    response.set_cookie(
+        STAFF_TOKEN_COOKIE, issue_token(role, code),
+        max_age=STAFF_TOKEN_MAX_AGE, httponly=True, samesite='Lax', secure=request.is_secure()
+    )
+    return response
+
+
+def _decode_token(token, roles):
+    """Содержимое токена, если подпись верна и роль подходит; без БД"""
+    if not token:
+        return None
+    try:
+        payload = signing.loads(token, salt=STAFF_TOKEN_SALT, max_age=STAFF_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return payload if payload.get('r') in roles else None
+
+
+def _accept(payload):
+    member = StaffMember(payload['r'], payload.get('c'))
+    return member, time.time() - payload.get('i', 0) > STAFF_TOKEN_REFRESH_AFTER
+
+
+def verify_token(token, roles):
+    """Возвращает (StaffMember или None, нужно ли перевыпустить токен)"""
+    payload = _decode_token(token, roles)
+    if payload is None:
+        return None, False
+
+    if payload.get('e') != current_epoch():
+        role, code = payload['r'], payload.get('c')
+        if not STAFF_MODELS[role].objects.filter(code=code, is_active=True).exists():
+            return None, False
+        return StaffMember(role, code), True
+
+    return _accept(payload)
+
+
+async def averify_token(token, roles):
+    """verify_token для async view: в поток с БД уходит только то, что без неё не решить"""
+    payload = _decode_token(token, roles)
+    if payload is None:
+        return None, False
+
+    with _epoch_lock:
+        fresh = _epoch['value'] is not None and time.monotonic() - _epoch['checked_at'] < EPOCH_CACHE_SECONDS
+        epoch = _epoch['value']
+    if fresh and payload.get('e') == epoch:
+        return _accept(payload)
+    return await sync_to_async(verify_token)(token, roles)
+
+
+def staff_api(*roles):
+    """
+    Проверяет подписанный токен сотрудника без сессии и запросов к таблицам персонала.
+
+    Кладёт результат в request.staff (None — не авторизован); ответ на
+    неавторизованный запрос формирует сама view.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                request.staff, refresh = await averify_token(request.COOKIES.get(STAFF_TOKEN_COOKIE), roles)
+                response = await view(request, *args, **kwargs)
+                if refresh:
+                    # Новый токен берёт эпоху, которая может потребовать запроса к БД
+                    await sync_to_async(set_token_cookie)(response, request, request.staff.role, request.staff.code)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            request.staff, refresh = verify_token(request.COOKIES.get(STAFF_TOKEN_COOKIE), roles)
+            response = view(request, *args, **kwargs)
+            if refresh:
+                set_token_cookie(response, request, request.staff.role, request.staff.code)
+            return response
+        return wrapper
+    return decorator
@@ -4,24 +4,53 @@ const wrapper = document.querySelector('.orders-wrapper');
 // --- Хранилище подтверждений ---
 let confirmStack = {};
 
-// --- Пинг каждые 5 сек ---
-setInterval(loadOrders, 5000);
+// --- Заказы на экране и версия последнего ответа сервера ---
+const ordersByCode = new Map();
+let version = null;
+
+// --- Пинг каждые 5 сек; при живом потоке событий — раз в 30 сек про запас ---
+const POLL_MS = 5000;
+const POLL_WITH_EVENTS_MS = 30000;
+let pollTimer = setInterval(loadOrders, POLL_MS);
 loadOrders();
 
+function setPollInterval(ms) {
+    clearInterval(pollTimer);
+    pollTimer = setInterval(loadOrders, ms);
+}
+
+// --- Push-события (SSE): новый или изменённый заказ — сразу дочитываем изменения ---
+if (window.EventSource) {
+    const events = new EventSource('/api/events/');
+    events.onopen = () => {
+        setPollInterval(POLL_WITH_EVENTS_MS);
+        loadOrders();
+    };
+    events.addEventListener('order', loadOrders);
+    events.onerror = () => setPollInterval(POLL_MS);
+}
+
 // --- Функция загрузки ---
+// После первого снимка запрашиваем только изменения (?since=версия),
+// сервер отвечает 304, если в очереди ничего не поменялось
 function loadOrders() {
-    fetch('/api/orders/')
+    const url = version === null ? '/api/orders/' : '/api/orders/?since=' + version;
+
+    fetch(url)
         .then(r => {
             if (r.status === 401) {
                 // Не авторизован - перенаправить на вход
                 window.location.href = '/chef/login/';
                 return;
             }
+            if (r.status === 304) {
+                return;
+            }
             return r.json();
         })
         .then(data => {
             if (data) {
-                renderOrders(data.orders);
+                applyChanges(data);
             }
         })
         .catch(err => {
@@ -29,6 +58,20 @@ function loadOrders() {
         });
 }
 
+// --- Применение снимка или изменений ---
+function applyChanges(data) {
+    if (data.full) {
+        ordersByCode.clear();
+    }
+    (data.removed || []).forEach(code => ordersByCode.delete(code));
+    data.orders.forEach(order => ordersByCode.set(order.public_code, order));
+    version = data.version;
+
+    const orders = [...ordersByCode.values()]
+        .sort((a, b) => b.created_at.localeCompare(a.created_at));
+    renderOrders(orders);
+}
+
 // --- Рендер ---
 function renderOrders(orders) {
     wrapper.innerHTML = '';
@@ -107,54 +150,82 @@ function confirmAction(code, status, btn) {
     if (status === "ready") {
         const block = document.getElementById("ord-" + code);
         if (block) block.remove();
+        ordersByCode.delete(code);
     }
 }
 
 // --- Обновление статуса ---
+// Нажатия копятся секунду и уходят одним пакетом (/api/update/batch/).
+// Шлём и статус, который видели: если заказ уже изменили, он вернётся как conflict.
+// Локальный статус меняем сразу, не дожидаясь опроса: следующее нажатие
+// (Готово после Готовить) ждёт уже новый статус, а ответ сервера его уточняет
+const BATCH_DELAY_MS = 1000;
+let pendingUpdates = [];
+let batchTimer = null;
+
 function setStatus(code, status) {
-    fetch('/api/update/', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-            'X-CSRFToken': getCookie('csrftoken')
-        },
-        body: JSON.stringify({
+    // Повторное нажатие по тому же заказу (Готовить → Готово) — один переход
+    const pending = pendingUpdates.find(update => update.public_code === code);
+    const order = ordersByCode.get(code);
+    if (pending) {
+        pending.status = status;
+    } else {
+        pendingUpdates.push({
             public_code: code,
-            status: status
-        })
-    })
-    .then(r => {
-        if (r.status === 401) {
-            window.location.href = '/chef/login/';
-        }
-        return r.json();
-    })
-    .catch(err => {
-        console.error('Ошибка обновления статуса:', err);
-    });
+            status: status,
+            expected_status: order ? order.status : ''
+        });
+    }
+    if (order) {
+        order.status = status;
+    }
+
+    clearTimeout(batchTimer);
+    batchTimer = setTimeout(sendUpdates, BATCH_DELAY_MS);
 }
 
-// --- Обновление статуса ---
-function setStatus(code, status) {
-    fetch('/api/update/', {
+function sendUpdates() {
+    const updates = pendingUpdates;
+    pendingUpdates = [];
+    if (updates.length === 0) return;
+
+    fetch('/api/update/batch/', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
-            'X-CSRFToken': getCookie('csrftoken')  // ← ДОБАВИТЬ
+            'X-CSRFToken': getCookie('csrftoken')
         },
-        body: JSON.stringify({
-            public_code: code,
-            status: status
-        })
+        body: JSON.stringify({ orders: updates })
     })
     .then(r => {
         if (r.status === 401) {
             window.location.href = '/chef/login/';
+            return;
         }
         return r.json();
     })
+    .then(data => {
+        if (!data || !data.results) return;
+
+        // Статус из ответа — то, что сейчас в БД, в том числе при conflict
+        data.results.forEach(result => {
+            const order = ordersByCode.get(result.public_code);
+            if (!order) return;
+            if (result.result === 'not_found') {
+                ordersByCode.delete(result.public_code);
+            } else if (result.status) {
+                order.status = result.status;
+            }
+        });
+        if (data.results.some(result => result.result !== 'ok')) {
+            loadOrders();
+        }
+    })
     .catch(err => {
         console.error('Ошибка обновления статуса:', err);
+        // Локальные статусы могли разойтись с сервером — берём полный снимок
+        version = null;
+        loadOrders();
     });
 }
 
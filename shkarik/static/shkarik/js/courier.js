@@ -2,11 +2,30 @@ document.addEventListener("DOMContentLoaded", () => {
     const wrapper = document.querySelector('.orders-wrapper');
     let activeOrderCode = localStorage.getItem("activeDelivery") || null;
 
-    setInterval(loadOrders, 4000);
+    // Опрос каждые 4 сек; при живом потоке событий — раз в 30 сек про запас
+    const POLL_MS = 4000;
+    const POLL_WITH_EVENTS_MS = 30000;
+    let pollTimer = setInterval(loadOrders, POLL_MS);
     loadOrders();
 
+    function setPollInterval(ms) {
+        clearInterval(pollTimer);
+        pollTimer = setInterval(loadOrders, ms);
+    }
+
+    // Push-события (SSE): заказ готов или изменился — сразу обновляем список
+    if (window.EventSource) {
+        const events = new EventSource('/api/events/');
+        events.onopen = () => {
+            setPollInterval(POLL_WITH_EVENTS_MS);
+            loadOrders();
+        };
+        events.addEventListener('order', loadOrders);
+        events.onerror = () => setPollInterval(POLL_MS);
+    }
+
     function loadOrders() {
-        fetch('/api/courier/?code=' + COURIER_CODE)
+        fetch('/api/courier/')
             .then(r => {
                 if (r.status === 401) {
                     window.location.href = '/courier/login/';
@@ -118,15 +137,17 @@ document.addEventListener("DOMContentLoaded", () => {
             body: JSON.stringify({
                 public_code: code,
                 status: "delivering",
+                expected_status: "ready",
                 accepted_by: COURIER_CODE
             })
         })
-        .then(r => r.json())
-        .then(data => {
-            if (data && data.success) {
-                loadOrders();
+        .then(r => {
+            if (r.status === 409) {
+                alert('Заказ уже взял другой курьер');
             }
-        });
+            return r.json();
+        })
+        .then(() => loadOrders());
     };
 
     // === ДОСТАВЛЕНО ===
@@ -141,12 +162,14 @@ document.addEventListener("DOMContentLoaded", () => {
             },
             body: JSON.stringify({
                 public_code: code,
-                status: "completed"
+                status: "completed",
+                expected_status: "delivering"
             })
         })
         .then(r => r.json())
         .then(data => {
-            if (data && data.success) {
+            // 409 — заказ уже изменили: обновляем список в любом случае
+            if (data && (data.success || data.status)) {
                 loadOrders();
             }
         });
@@ -164,12 +187,14 @@ document.addEventListener("DOMContentLoaded", () => {
             },
             body: JSON.stringify({
                 public_code: code,
-                status: "cancelled"
+                status: "cancelled",
+                expected_status: "delivering"
             })
         })
         .then(r => r.json())
         .then(data => {
-            if (data && data.success) {
+            // 409 — заказ уже изменили: обновляем список в любом случае
+            if (data && (data.success || data.status)) {
                 loadOrders();
             }
         });
@@ -1,3 +1,19 @@
+// Автообновление статуса: браузер шлёт If-None-Match, и пока статус
+// не изменился, сервер отвечает 304 без обращения к базе
+const statusContainer = document.querySelector('.success-container');
+if (statusContainer && statusContainer.dataset.statusUrl) {
+  setInterval(() => {
+    fetch(statusContainer.dataset.statusUrl, { cache: 'no-cache' })
+      .then(r => r.ok ? r.json() : null)
+      .then(data => {
+        if (data && data.status !== statusContainer.dataset.status) {
+          location.reload();
+        }
+      })
+      .catch(() => {});
+  }, 10000);
+}
+
 // Функция скриншота
 function takeScreenshot() {
   alert(
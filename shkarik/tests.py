@@ -1,3 +1,1387 @@
-from django.test import TestCase
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from contextlib import ExitStack
+from io import BytesIO, StringIO
+from time import sleep
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count, Q
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from . import views
+from .codes import public_codes
+from .archive import archive_orders
+from .models import ArchivedOrder, Chef, Courier, DailyDishSales, DailySales, Order, OrderItem, Product
+from .metrics import MetricsStore, get_store
+from .ratelimit import SlidingWindowLimiter, get_limiter
+from .rollups import diff_rollups, rebuild_rollups
+from .seeding import seed_database
+from .slowlog import fingerprint, slow_queries
+from .staff import STAFF_TOKEN_COOKIE, issue_token, reset_epoch_cache
+
+
+# сессия + пользователь + итоги + живые заказы + топ блюд + часы + курьеры со статистикой
+DASHBOARD_QUERY_BUDGET = 7
+
+
+# Счётчики лимитов и метрики живут в отдельных файлах SQLite — тестам свои
+RATELIMIT_TEST_DB = os.path.join(tempfile.gettempdir(), f'shkarik-ratelimit-{os.getpid()}.sqlite3')
+METRICS_TEST_DB = os.path.join(tempfile.gettempdir(), f'shkarik-metrics-{os.getpid()}.sqlite3')
+
+
+@override_settings(
+    PRODUCT_IMAGE_WORKERS=0, RATELIMIT_DB=RATELIMIT_TEST_DB, METRICS_DB=METRICS_TEST_DB, SLOW_QUERY_MS=None,
+)
+class ShkarikTestCase(TestCase):
+    """Сбрасывает состояние процесса, которое переживает откат транзакции теста"""
+
+    def setUp(self):
+        public_codes.reset()
+        reset_epoch_cache()
+        get_limiter().reset()
+        get_store().reset()
+        slow_queries.reset()
+        cache.clear()
+
+
+def order_payload(**overrides):
+    payload = {
+        'client_name': 'Арсен',
+        'client_phone': '+996700123456',
+        'delivery_type': 'pickup',
+        'cart': [
+            {'name': 'Шаурма', 'price': 150, 'quantity': 2},
+            {'name': 'Кофе', 'price': 50, 'quantity': 1},
+        ],
+    }
+    payload.update(overrides)
+    return payload
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class CreateOrderTests(ShkarikTestCase):
+
+    def post_order(self, **overrides):
+        return self.client.post(
+            '/create-order/',
+            data=json.dumps(order_payload(**overrides)),
+            content_type='application/json'
+        )
+
+    def test_order_and_items_created(self):
+        response = self.post_order()
+
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get(public_code=response.json()['public_code'])
+        self.assertEqual(order.total_price, 350)
+        self.assertEqual(order.items.count(), 2)
+
+    def test_items_written_in_single_insert(self):
+        cart = [{'name': f'Блюдо {i}', 'price': 10, 'quantity': 1} for i in range(30)]
+        self.post_order()   # резервирует блок публичных кодов
+
+        with self.assertNumQueries(6):
+            # SAVEPOINT + UPDATE/SELECT версии + INSERT заказа + INSERT позиций + RELEASE
+            response = self.post_order(cart=cart)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(OrderItem.objects.filter(order__public_code=response.json()['public_code']).count(), 30)
+
+    def test_code_collision_is_retried(self):
+        taken = self.post_order().json()['public_code']
+
+        with mock.patch.object(Order, 'generate_public_code', side_effect=[taken, '#ZZZZ']):
+            response = self.post_order()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['public_code'], '#ZZZZ')
+
+
+def make_order(**fields):
+    fields.setdefault('client_name', 'Арсен')
+    fields.setdefault('client_phone', '+996700123456')
+    fields.setdefault('delivery_type', 'pickup')
+    fields.setdefault('total_price', 100)
+    order = Order.objects.create(**fields)
+    OrderItem.objects.create(order=order, product_name='Шаурма', product_price=100, quantity=1)
+    return order
+
+
+def complete(order, status='completed'):
+    order = Order.objects.get(pk=order.pk)
+    order.status = status
+    order.save()
+    return order
+
+
+def hammer_limiter(path, hits, limit, results):
+    """Процесс-нагрузчик: сколько его запросов лимитер пропустил"""
+    limiter = SlidingWindowLimiter(path)
+    results.put(sum(not limiter.hit('shared', limit, 3600) for _ in range(hits)))
+
+
+class RateLimitTests(ShkarikTestCase):
+
+    def test_previous_window_still_counts(self):
+        limiter = get_limiter()
+        self.assertEqual([limiter.hit('k', 3, 60, now=59) for _ in range(4)], [False] * 3 + [True])
+
+        # Фиксированное окно пропустило бы сразу после границы, скользящее — нет
+        self.assertTrue(limiter.hit('k', 3, 60, now=61))
+        self.assertFalse(limiter.hit('k', 3, 60, now=119))
+
+    def test_limit_is_global_across_processes(self):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [
+            context.Process(target=hammer_limiter, args=(RATELIMIT_TEST_DB, 25, 30, results))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        allowed = sum(results.get(timeout=30) for _ in workers)
+        for worker in workers:
+            worker.join()
+
+        # 4 процесса × 25 запросов, лимит 30 на всех вместе
+        self.assertEqual(allowed, 30)
+
+    @override_settings(RATELIMIT_ENABLE=True)
+    def test_create_order_answers_429(self):
+        def post():
+            return self.client.post('/create-order/', json.dumps(order_payload()), content_type='application/json')
+
+        for _ in range(10):
+            self.assertEqual(post().status_code, 200)
+        self.assertEqual(post().status_code, 429)
+
+
+def run_command(*args):
+    """manage.py в отдельном процессе; файлы метрик и лимитов — во временной папке, а не в репозитории"""
+    scratch = tempfile.mkdtemp()
+    try:
+        return subprocess.run(
+            [sys.executable, str(settings.BASE_DIR / 'manage.py'), *args],
+            capture_output=True, text=True, check=True, timeout=120,
+            env={
+                **os.environ,
+                'METRICS_DB': os.path.join(scratch, 'metrics.sqlite3'),
+                'RATELIMIT_DB': os.path.join(scratch, 'ratelimit.sqlite3'),
+            },
+        )
+    finally:
+        shutil.rmtree(scratch)
+
+
+class SQLiteConcurrencyTests(SimpleTestCase):
+
+    def test_concurrent_writers_never_see_locked(self):
+        # Отдельный процесс: нагрузка идёт на временный файл БД, а не на тестовую БД в памяти
+        output = run_command('bench_sqlite', '--mode', 'tuned', '--workers', '4', '--orders', '10', '--json').stdout
+
+        result = json.loads(output)['tuned']
+        self.assertEqual(result['orders'], 40)
+        self.assertEqual(result['locked'], 0)
+
+
+class EndpointBenchmarkTests(SimpleTestCase):
+
+    def test_every_endpoint_in_mix_succeeds(self):
+        output = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(output))
+
+        run_command('bench_endpoints', '--history', '100', '--requests', '150', '--output', output)
+
+        with open(output) as file:
+            report = json.load(file)
+        self.assertEqual(report['total']['requests'], 150)
+        for name, row in report['endpoints'].items():
+            self.assertEqual(row['errors'], 0, name)
+            self.assertLessEqual(row['p50_ms'], row['p95_ms'])
+            self.assertLessEqual(row['p95_ms'], row['p99_ms'])
+
+
+class ChefLoginMixin:
+
+    def login_chef(self):
+        Chef.objects.create(name='Повар', code='chef1')
+        session = self.client.session
+        session['chef_code'] = 'chef1'
+        session.save()
+        self.client.cookies[STAFF_TOKEN_COOKIE] = issue_token('chef', 'chef1')
+        self.async_client.cookies = self.client.cookies
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class ChefOrdersFeedTests(ChefLoginMixin, ShkarikTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login_chef()
+
+    def test_full_snapshot_batches_items(self):
+        for _ in range(5):
+            make_order()
+
+        # версия + заказы + позиции одним запросом (токен проверяется без БД)
+        with self.assertNumQueries(3):
+            data = self.client.get('/api/orders/').json()
+
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['orders']), 5)
+        self.assertEqual(data['orders'][0]['items'][0]['name'], 'Шаурма')
+
+    def test_not_modified_when_nothing_changed(self):
+        make_order()
+        version = self.client.get('/api/orders/').json()['version']
+
+        response = self.client.get('/api/orders/', {'since': version})
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_delta_contains_only_changes(self):
+        first = make_order()
+        second = make_order()
+        version = self.client.get('/api/orders/').json()['version']
+
+        third = make_order()
+        first.status = 'ready'
+        first.save()
+
+        data = self.client.get('/api/orders/', {'since': version}).json()
+
+        self.assertFalse(data['full'])
+        self.assertEqual([o['public_code'] for o in data['orders']], [third.public_code])
+        self.assertEqual(data['removed'], [first.public_code])
+        self.assertNotIn(second.public_code, [o['public_code'] for o in data['orders']])
+
+    def test_delta_lists_deleted_active_orders(self):
+        first = make_order()
+        second = make_order(status='cooking')
+        done = make_order(status='completed')
+        version = self.client.get('/api/orders/').json()['version']
+
+        first.delete()
+        Order.objects.filter(pk__in=[second.pk, done.pk]).delete()
+
+        data = self.client.get('/api/orders/', {'since': version}).json()
+
+        self.assertFalse(data['full'])
+        self.assertEqual(data['orders'], [])
+        self.assertCountEqual(data['removed'], [first.public_code, second.public_code])
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class StaffTokenTests(ChefLoginMixin, ShkarikTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login_chef()
+        self.client.session.flush()   # API не должно зависеть от сессии
+
+    def test_poll_without_session_or_staff_queries(self):
+        version = self.client.get('/api/orders/').json()['version']
+
+        with self.assertNumQueries(1):   # только версия заказов
+            response = self.client.get('/api/orders/', {'since': version})
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_deactivation_revokes_token(self):
+        chef = Chef.objects.get(code='chef1')
+        chef.is_active = False
+        chef.save()
+        reset_epoch_cache()   # в жизни — истечение EPOCH_CACHE_SECONDS
+
+        self.assertEqual(self.client.get('/api/orders/').status_code, 401)
+
+    def test_epoch_change_reissues_token_for_active_staff(self):
+        Courier.objects.create(name='Новый курьер', code='c9')
+        reset_epoch_cache()
+
+        response = self.client.get('/api/orders/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(STAFF_TOKEN_COOKIE, response.cookies)
+
+    def test_tampered_token_rejected(self):
+        self.client.cookies[STAFF_TOKEN_COOKIE] = issue_token('chef', 'chef1') + 'x'
+
+        self.assertEqual(self.client.get('/api/orders/').status_code, 401)
+
+    def test_courier_identity_comes_from_token(self):
+        Courier.objects.create(name='Курьер', code='c1')
+        Courier.objects.create(name='Другой', code='c2')
+        order = make_order(delivery_type='delivery', status='ready', address='ул. Ленина')
+        self.client.cookies[STAFF_TOKEN_COOKIE] = issue_token('courier', 'c1')
+
+        self.assertEqual(len(self.client.get('/api/courier/').json()['orders']), 1)
+        self.assertEqual(self.client.get('/api/orders/').status_code, 401)
+
+        response = self.client.post('/api/update/', json.dumps({
+            'public_code': order.public_code, 'status': 'delivering', 'accepted_by': 'c2'
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_courier_accepts_by_code_and_keeps_history(self):
+        courier = Courier.objects.create(name='Курьер', code='c1')
+        order = make_order(delivery_type='delivery', status='ready', address='ул. Ленина')
+        self.client.cookies[STAFF_TOKEN_COOKIE] = issue_token('courier', 'c1')
+
+        for status in ('delivering', 'completed'):
+            response = self.client.post('/api/update/', json.dumps({
+                'public_code': order.public_code, 'status': status, 'accepted_by': 'c1'
+            }), content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+
+        courier.code = 'c1-new'
+        courier.save()
+        self.assertEqual(list(courier.orders.all()), [order])
+
+
+@override_settings(RATELIMIT_ENABLE=False, METRICS_TOKEN='scrape')
+class RequestMetricsTests(ChefLoginMixin, ShkarikTestCase):
+
+    def scrape(self):
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_histograms_per_url_name(self):
+        self.login_chef()
+        make_order()
+        for _ in range(3):
+            self.client.get('/api/orders/')
+
+        text = self.scrape()
+
+        labels = 'view="get_orders",method="GET"'
+        self.assertIn(f'shkarik_request_duration_seconds_count{{{labels}}} 3', text)
+        self.assertIn(f'shkarik_db_queries_sum{{{labels}}} 9', text)   # версия + заказы + позиции
+        self.assertIn(f'shkarik_db_queries_bucket{{{labels},le="2"}} 0', text)
+        self.assertIn(f'shkarik_db_queries_bucket{{{labels},le="3"}} 3', text)
+        self.assertIn(f'shkarik_response_size_bytes_count{{{labels}}} 3', text)
+
+    def test_server_timing_only_for_staff(self):
+        self.assertNotIn('Server-Timing', self.client.get('/'))
+
+        self.login_chef()
+        make_order()
+        response = self.client.get('/api/orders/')
+
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="3 queries"$')
+
+    def test_workers_aggregate_through_shared_file(self):
+        workers = [MetricsStore(METRICS_TEST_DB) for _ in range(2)]
+        for store in workers:
+            self.addCleanup(store.close)
+            store.record('home', 'GET', db_queries=1)
+            store.flush()
+
+        self.assertEqual(get_store().snapshot()[('home', 'GET', 'db_queries')][1], 2)   # корзина le="1"
+
+    def test_flushed_by_background_thread_only(self):
+        store = MetricsStore(METRICS_TEST_DB)
+        self.addCleanup(store.close)
+        flushed_by = []
+        flush = store.flush
+
+        def tracking_flush():
+            flushed_by.append(threading.current_thread().name)
+            flush()
+
+        with mock.patch('shkarik.metrics.FLUSH_EVERY', 0.01), mock.patch.object(store, 'flush', tracking_flush):
+            for _ in range(5):
+                store.record('home', 'GET', db_queries=1)
+                sleep(0.01)
+            for _ in range(100):
+                if flushed_by and not store._pending:
+                    break
+                sleep(0.01)
+
+        self.assertEqual(set(flushed_by), {'metrics-flush'})
+        self.assertEqual(get_store().snapshot()[('home', 'GET', 'db_queries')][1], 5)
+
+    def test_endpoint_requires_staff_or_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+        self.client.force_login(User.objects.create_user('owner', password='x', is_staff=True))
+        self.assertEqual(self.client.get('/metrics/').status_code, 200)
+
+
+class SlowQueryLogTests(ShkarikTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('owner', password='x', is_staff=True))
+
+    def slow_logging(self):
+        """Журналировать всё — только внутри блока, иначе подготовка теста шумит в stderr"""
+        stack = ExitStack()
+        stack.enter_context(self.settings(SLOW_QUERY_MS=0))
+        stack.enter_context(self.assertLogs('shkarik.slowlog', 'WARNING'))
+        return stack
+
+    def test_fingerprint_ignores_values(self):
+        first = fingerprint('SELECT * FROM shkarik_order WHERE id IN (%s, %s) AND status = \'new\' LIMIT 21')
+        second = fingerprint('SELECT * FROM  shkarik_order WHERE id IN (%s, %s, %s) AND status = \'ready\' LIMIT 5')
+
+        self.assertEqual(first, second)
+        self.assertEqual(first[1], 'SELECT * FROM shkarik_order WHERE id IN (...) AND status = ? LIMIT ?')
+
+    def test_queries_attributed_to_view_with_rows(self):
+        for i in range(3):
+            Courier.objects.create(name=f'Курьер {i}', code=f'c{i}')
+
+        with self.slow_logging():
+            self.client.get('/xjf8k2n9s/')
+
+        couriers = [q for q in slow_queries.top(100) if q['sql'].startswith('SELECT "shkarik_courier"')]
+        self.assertEqual(len(couriers), 1)
+        self.assertEqual(couriers[0]['rows'], 3)
+        self.assertEqual(couriers[0]['origins'], {'owner_dashboard': 1})
+
+    def test_django_built_queries_attributed_to_url(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+        with self.slow_logging():
+            self.client.get('/admin/shkarik/order/')
+
+        origins = {origin for q in slow_queries.top(100) for origin in q['origins']}
+        self.assertIn('admin:shkarik_order_changelist', origins)
+
+    @override_settings(SLOW_QUERY_MS=10_000)
+    def test_fast_queries_not_recorded(self):
+        self.client.get('/xjf8k2n9s/')
+
+        self.assertEqual(slow_queries.top(), [])
+
+    def test_report_for_staff_only(self):
+        with self.slow_logging():
+            self.assertContains(self.client.get('/metrics/slow-queries/'), 'Медленные SQL-запросы')
+            self.client.logout()
+            self.assertEqual(self.client.get('/metrics/slow-queries/').status_code, 302)
+
+
+class OwnerDashboardTests(ShkarikTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('owner', password='x', is_staff=True))
+
+    def seed(self, couriers, first=0):
+        for i in range(first, first + couriers):
+            courier = Courier.objects.create(name=f'Курьер {i}', code=f'c{i}')
+            make_order(delivery_type='delivery', status='delivering', accepted_by=courier)
+        for days_ago in range(10):
+            order = make_order(total_price=200)
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+            complete(order)
+
+    def test_query_budget_does_not_grow(self):
+        self.seed(couriers=2)
+        with self.assertNumQueries(DASHBOARD_QUERY_BUDGET):
+            self.client.get('/xjf8k2n9s/')
+
+        self.seed(couriers=10, first=2)
+        with self.assertNumQueries(DASHBOARD_QUERY_BUDGET):
+            response = self.client.get('/xjf8k2n9s/')
+
+        self.assertEqual(len(response.context['couriers_stats']), 12)
+
+    def test_metrics(self):
+        self.seed(couriers=1)
+
+        context = self.client.get('/xjf8k2n9s/').context
+
+        self.assertEqual(context['revenue_today'], 200)
+        self.assertEqual(context['revenue_week'], 7 * 200)
+        self.assertEqual(context['orders_week'], 8)
+        self.assertEqual([day['total'] for day in context['sales_by_day']], [200.0] * 7)
+        self.assertEqual(context['couriers_stats'][0]['deliveries'], 1)
+        self.assertTrue(context['couriers_stats'][0]['is_active'])
+
+    def test_top_dishes_and_hours(self):
+        complete(make_order())
+        complete(make_order(), status='cancelled')
+        make_order()
+
+        context = self.client.get('/xjf8k2n9s/').context
+
+        self.assertEqual(context['top_dishes'], [{'name': 'Шаурма', 'quantity': 1, 'revenue': 100}])
+        hour = timezone.localtime().hour
+        self.assertEqual(sum(slot['count'] for slot in context['time_slots']), 3 if 9 <= hour < 22 else 0)
+
+
+class AdminQueryTests(ShkarikTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+    def add_couriers(self, count, first=0):
+        for i in range(first, first + count):
+            courier = Courier.objects.create(name=f'Курьер {i}', code=f'c{i}')
+            make_order(delivery_type='delivery', status='delivering', accepted_by=courier)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_order_changelist_batches_couriers(self):
+        self.add_couriers(2)
+        few, _ = self.count_queries('/admin/shkarik/order/')
+
+        self.add_couriers(20, first=2)
+        many, response = self.count_queries('/admin/shkarik/order/')
+
+        self.assertEqual(few, many)
+        self.assertContains(response, 'Курьер 21')
+
+    def test_courier_changelist_annotates_deliveries(self):
+        self.add_couriers(2)
+        few, _ = self.count_queries('/admin/shkarik/courier/')
+
+        self.add_couriers(20, first=2)
+        many, _ = self.count_queries('/admin/shkarik/courier/')
+
+        self.assertEqual(few, many)
+
+    def test_delivery_history_keyset_pages(self):
+        courier = Courier.objects.create(name='Курьер', code='c1')
+        orders = [make_order(delivery_type='delivery', status='delivering', accepted_by=courier) for _ in range(55)]
+        url = f'/admin/shkarik/courier/{courier.pk}/deliveries/'
+
+        first = self.client.get(url)
+        self.assertEqual(first.context['stats']['total_count'], 55)
+        self.assertEqual(len(first.context['orders']), 50)
+
+        second = self.client.get(url, {'before': first.context['next_before']})
+        self.assertEqual([o.pk for o in second.context['orders']], [o.pk for o in reversed(orders[:5])])
+        self.assertIsNone(second.context['next_before'])
+
+        self.assertContains(self.client.get(f'/admin/shkarik/courier/{courier.pk}/change/'), 'Более ранние доставки')
+
+
+class IndexPlanTests(ShkarikTestCase):
+    """Горячие запросы к заказам не должны сканировать таблицу целиком"""
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index}', plan.replace('COVERING INDEX', 'INDEX'))
+        self.assertNotRegex(plan, r'SCAN shkarik_order(?! USING)')
+
+    def test_chef_queue(self):
+        self.assertUsesIndex(
+            Order.objects.filter(status__in=['new', 'cooking']).order_by('-created_at')[:50],
+            'order_status_created_idx'
+        )
+
+    def test_courier_feed(self):
+        self.assertUsesIndex(
+            Order.objects.filter(delivery_type='delivery').filter(
+                Q(status='ready') | Q(status='delivering', accepted_by__code='c1')
+            ).order_by('-created_at')[:20],
+            'order_status_created_idx'
+        )
+
+    def test_dashboard_live_orders(self):
+        month_start = timezone.make_aware(datetime.combine(timezone.localdate() - timedelta(days=30), time.min))
+        self.assertUsesIndex(
+            Order.objects.filter(
+                status__in=['new', 'cooking', 'ready', 'delivering'], created_at__gte=month_start
+            ).values_list('created_at', flat=True),
+            'order_status_created_idx'
+        )
+
+    def test_courier_queries_use_partial_index(self):
+        self.assertUsesIndex(
+            Courier.objects.annotate(n=Count('orders', filter=Q(orders__status='completed'))),
+            'order_accepted_by_idx'
+        )
+        self.assertUsesIndex(Order.objects.filter(accepted_by=1, status='completed'), 'order_accepted_by_idx')
+
+    def test_courier_history_page_needs_no_sort(self):
+        page = Order.objects.filter(accepted_by=1, id__lt=1000).order_by('-id')[:51]
+
+        self.assertUsesIndex(page, 'order_accepted_by_idx')
+        self.assertNotIn('TEMP B-TREE', page.explain())
+
+
+# ==================== БЮДЖЕТЫ ПРОИЗВОДИТЕЛЬНОСТИ ====================
+
+# Сколько SQL-запросов может сделать эндпоинт — при любом числе заказов и курьеров
+QUERY_BUDGETS = {
+    'chef_snapshot': 3,     # версия + заказы + позиции
+    'chef_delta': 4,        # версия + изменённые с версии + позиции + удалённые
+    'courier_feed': 1,
+    'order_status': 1,
+    'order_success': 1,
+    'update_status': 4,     # новая версия (UPDATE и SELECT) + условный UPDATE + чтение заказа
+    'update_batch': 4,      # блок версий (UPDATE и SELECT) + один UPDATE на всех + чтение заказов
+    'create_order': 6,
+    'dashboard': DASHBOARD_QUERY_BUDGET,
+    # дальше к каждому — сессия и пользователь админки
+    'admin_orders': 6,
+    'admin_couriers': 5,
+    'admin_deliveries': 9,  # + курьер, итоги и страница — по живым заказам и по архиву
+}
+
+# Эндпоинты, которые дёргаются постоянно: их запросы к заказам обязаны идти по индексу
+HOT_ENDPOINTS = {
+    'chef_snapshot', 'chef_delta', 'courier_feed', 'order_status', 'order_success',
+    'update_status', 'update_batch', 'create_order', 'dashboard',
+}
+
+FULL_SCAN_RE = re.compile(r'^SCAN (shkarik_order|shkarik_orderitem)\b(?! USING)')
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class PerformanceBudgetTests(ChefLoginMixin, ShkarikTestCase):
+    """
+    Число запросов каждого эндпоинта не растёт вместе с данными, а горячие
+    запросы к заказам не сканируют таблицы целиком (EXPLAIN QUERY PLAN
+    с теми же параметрами, с которыми их выполнил view).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.login_chef()
+        self.owner = self.client_class()
+        self.owner.force_login(User.objects.create_superuser('owner', password='x'))
+        self.courier = self.client_class()
+        self.courier.cookies[STAFF_TOKEN_COOKIE] = issue_token('courier', 'c0')
+        self.couriers = 0
+
+    def grow(self, couriers):
+        """Добавляет курьеров с доставками, завершённые и живые заказы"""
+        for i in range(self.couriers, self.couriers + couriers):
+            courier = Courier.objects.create(name=f'Курьер {i}', code=f'c{i}')
+            complete(make_order(delivery_type='delivery', status='delivering', accepted_by=courier))
+            make_order(delivery_type='delivery', status='delivering', accepted_by=courier)
+            make_order(delivery_type='delivery', status='ready')
+            make_order(status='cooking')
+        self.couriers += couriers
+
+    def requests(self):
+        order = Order.objects.filter(status='cooking').latest('id')
+        cooking = Order.objects.filter(status='cooking').exclude(pk=order.pk).values_list('public_code', flat=True)
+        batch = [{'public_code': code, 'expected_status': 'cooking', 'status': 'ready'} for code in cooking]
+        version = self.client.get('/api/orders/').json()['version']
+        make_order()
+        courier = Courier.objects.get(code='c0')
+        return {
+            'chef_snapshot': lambda: self.client.get('/api/orders/'),
+            'chef_delta': lambda: self.client.get('/api/orders/', {'since': version}),
+            'courier_feed': lambda: self.courier.get('/api/courier/'),
+            'order_status': lambda: self.client.get(f'/api/order-status/{order.secret_code}/'),
+            'order_success': lambda: self.client.get(f'/order-success/{order.secret_code}/'),
+            'update_status': lambda: self.client.post(
+                '/api/update/', json.dumps({'public_code': order.public_code, 'status': 'ready'}),
+                content_type='application/json',
+            ),
+            'update_batch': lambda: self.client.post(
+                '/api/update/batch/', json.dumps({'orders': batch}), content_type='application/json',
+            ),
+            'create_order': lambda: self.client.post(
+                '/create-order/', json.dumps(order_payload()), content_type='application/json'
+            ),
+            'dashboard': lambda: self.owner.get('/xjf8k2n9s/'),
+            'admin_orders': lambda: self.owner.get('/admin/shkarik/order/'),
+            'admin_couriers': lambda: self.owner.get('/admin/shkarik/courier/'),
+            'admin_deliveries': lambda: self.owner.get(f'/admin/shkarik/courier/{courier.pk}/deliveries/'),
+        }
+
+    def run_endpoints(self):
+        """{эндпоинт: [(sql, params), ...]} — всё, что он выполнил"""
+        executed = {}
+        for name, request in self.requests().items():
+            cache.clear()   # считаем холодный путь, а не попадание в кэш
+            statements = []
+
+            def record(execute, sql, params, many, context):
+                statements.append((sql, params))
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(record):
+                response = request()
+            self.assertLess(response.status_code, 400, name)
+            executed[name] = statements
+        return executed
+
+    def test_query_counts_within_budget_and_flat(self):
+        self.grow(couriers=2)
+        few = self.run_endpoints()
+        self.grow(couriers=15)
+        many = self.run_endpoints()
+
+        for name, budget in QUERY_BUDGETS.items():
+            with self.subTest(name):
+                self.assertEqual(len(few[name]), len(many[name]), 'число запросов растёт с данными (N+1)')
+                self.assertLessEqual(len(many[name]), budget)
+
+    def test_hot_queries_never_scan_orders(self):
+        self.grow(couriers=3)
+
+        for name, statements in self.run_endpoints().items():
+            if name not in HOT_ENDPOINTS:
+                continue
+            for sql, params in statements:
+                if not sql.startswith('SELECT') or 'shkarik_order' not in sql:
+                    continue
+                with self.subTest(name, sql=sql), connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                    plan = [row[-1] for row in cursor.fetchall()]
+                    self.assertFalse([step for step in plan if FULL_SCAN_RE.match(step)], plan)
+
+
+class SalesRollupTests(ShkarikTestCase):
+
+    def test_incremental_matches_rebuild(self):
+        first = complete(make_order())
+        complete(make_order(), status='cancelled')
+        make_order()
+        complete(first, status='cancelled')   # выполнен → отменён переносит вклад
+        complete(make_order())
+
+        self.assertEqual(diff_rollups(), [])
+        day = DailySales.objects.get()
+        self.assertEqual((day.orders, day.completed, day.cancelled, day.revenue), (3, 1, 2, 100))
+
+    def test_deferred_status_not_counted_twice(self):
+        order = complete(make_order())
+
+        deferred = Order.objects.defer('status').get(pk=order.pk)
+        deferred.comment = 'Позвонить'
+        deferred.save()
+        self.assertEqual(DailySales.objects.get().completed, 1)
+
+        deferred = Order.objects.only('id', 'created_at', 'total_price').get(pk=order.pk)
+        deferred.status = 'cancelled'
+        deferred.save()
+        day = DailySales.objects.get()
+        self.assertEqual((day.orders, day.completed, day.cancelled, day.revenue), (1, 0, 1, 0))
+        self.assertEqual(diff_rollups(), [])
+
+    def test_rebuild_restores_rollups(self):
+        complete(make_order())
+        DailySales.objects.update(revenue=0)
+        self.assertNotEqual(diff_rollups(), [])
+
+        rebuild_rollups()
+
+        self.assertEqual(diff_rollups(), [])
+
+
+class OrderArchiveTests(ShkarikTestCase):
+
+    def make_old(self, days=40, status='completed', **fields):
+        order = make_order(**fields)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days))
+        return complete(order, status=status)
+
+    def test_moves_only_old_finished_orders(self):
+        old = self.make_old()
+        recent = complete(make_order())
+        active = make_order()
+        Order.objects.filter(pk=active.pk).update(created_at=timezone.now() - timedelta(days=40))
+
+        call_command('archive_orders', '--days', '30', stdout=StringIO())
+
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), {recent.pk, active.pk})
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual((archived.pk, archived.secret_code), (old.pk, old.secret_code))
+        self.assertEqual(archived.items, [['Шаурма', 100, 1]])
+        self.assertFalse(OrderItem.objects.filter(order_id=old.pk).exists())
+
+    def test_batches_until_done(self):
+        for _ in range(7):
+            self.make_old()
+
+        self.assertEqual(archive_orders(days=30, batch_size=3), 7)
+        self.assertEqual(ArchivedOrder.objects.count(), 7)
+
+    def test_public_code_reusable(self):
+        old = self.make_old()
+        archive_orders(days=30)
+
+        self.assertEqual(make_order(public_code=old.public_code).public_code, old.public_code)
+
+    def test_tracking_finds_archived_order(self):
+        old = self.make_old()
+        archive_orders(days=30)
+
+        self.assertEqual(self.client.get(f'/api/order-status/{old.secret_code}/').json()['status'], 'completed')
+        self.assertEqual(self.client.get(f'/order-success/{old.secret_code}/').context['order'].pk, old.pk)
+
+    def test_rollups_rebuilt_with_archive(self):
+        self.make_old()
+        self.make_old(status='cancelled')
+        before = list(DailySales.objects.values())
+        archive_orders(days=30)
+
+        rebuild_rollups()
+
+        self.assertEqual(list(DailySales.objects.values('orders', 'completed', 'cancelled', 'revenue')),
+                         [{k: row[k] for k in ('orders', 'completed', 'cancelled', 'revenue')} for row in before])
+        self.assertEqual(diff_rollups(), [])
+
+    def test_courier_history_spans_archive(self):
+        courier = Courier.objects.create(name='Курьер', code='c1')
+        old = self.make_old(delivery_type='delivery', accepted_by=courier)
+        live = complete(make_order(delivery_type='delivery', accepted_by=courier))
+        archive_orders(days=30)
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+        response = self.client.get(f'/admin/shkarik/courier/{courier.pk}/deliveries/')
+
+        self.assertEqual(response.context['stats']['completed_count'], 2)
+        self.assertEqual([o.pk for o in response.context['orders']], [live.pk, old.pk])
+        self.assertContains(response, f'/admin/shkarik/archivedorder/{old.pk}/change/')
+        self.assertContains(self.client.get('/admin/shkarik/courier/'), '2 шт')
+
+
+class SyntheticDataTests(ShkarikTestCase):
+
+    def generate(self, seed):
+        Order.objects.all().delete()
+        Product.objects.all().delete()
+        Courier.objects.all().delete()
+        Chef.objects.all().delete()
+        seed_database(history=300, active=5, days=14, seed=seed, end=date(2026, 3, 1))
+        return list(Order.objects.order_by('id').values_list(
+            'secret_code', 'status', 'delivery_type', 'accepted_by__code', 'total_price', 'created_at'
+        ))
+
+    def test_same_seed_same_data(self):
+        first = self.generate(seed=7)
+
+        self.assertEqual(self.generate(seed=7), first)
+        self.assertNotEqual(self.generate(seed=8), first)
+
+    def test_history_shape(self):
+        self.generate(seed=1)
+        history = Order.objects.filter(status__in=['completed', 'cancelled'])
+
+        self.assertEqual(history.count(), 300)
+        self.assertFalse(history.filter(delivery_type='pickup', accepted_by__isnull=False).exists())
+        hours = [timezone.localtime(created).hour for created in history.values_list('created_at', flat=True)]
+        self.assertTrue(all(9 <= hour < 23 for hour in hours))
+        self.assertGreater(hours.count(13), hours.count(16))   # обеденный пик
+        self.assertEqual(diff_rollups(), [])
+
+
+class MenuCacheTests(ShkarikTestCase):
+
+    def add_product(self, name, **fields):
+        with self.captureOnCommitCallbacks(execute=True), mock.patch('shkarik.models.schedule_product_image'):
+            return Product.objects.create(
+                name=name, description='Описание', price=150, image='products/x.jpg', **fields
+            )
+
+    def test_warm_menu_served_without_queries(self):
+        self.add_product('Шаурма')
+        self.client.get('/')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/')
+
+        self.assertContains(response, 'Шаурма')
+
+    def test_conditional_request_gets_304(self):
+        self.add_product('Шаурма')
+        first = self.client.get('/')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_change_invalidates_menu(self):
+        product = self.add_product('Шаурма')
+        etag = self.client.get('/')['ETag']
+
+        product.name = 'Донер'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Донер')
+
+    def test_admin_bulk_delete_invalidates_menu(self):
+        product = self.add_product('Шаурма')
+        self.assertContains(self.client.get('/'), 'Шаурма')
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/admin/shkarik/product/', {
+                'action': 'delete_selected', '_selected_action': [product.pk], 'post': 'yes'
+            })
+
+        self.assertNotContains(self.client.get('/'), 'Шаурма')
+
+
+class ProductImageTests(ShkarikTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, name, size, mode='RGBA'):
+        buffer = BytesIO()
+        Image.new(mode, size, (200, 50, 50, 128) if mode == 'RGBA' else (200, 50, 50)).save(buffer, 'PNG')
+        return default_storage.save(f'products/{name}', ContentFile(buffer.getvalue()))
+
+    def add_product(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Шаурма', description='', price=150, image=image)
+        product.refresh_from_db()
+        return product
+
+    def test_derivatives_built_after_upload(self):
+        product = self.add_product(self.upload('big.png', (1200, 800)))
+
+        self.assertTrue(product.image_ready)
+        self.assertEqual(product.image_variants['widths'], [240, 480, 960])
+        for ext in ('webp', 'jpeg'):
+            for width, name in product.image_variants[ext].items():
+                self.assertIn(product.image_variants['hash'], name)
+                with default_storage.open(name) as stored, Image.open(stored) as image:
+                    self.assertEqual(image.width, int(width))
+
+    def test_small_image_not_upscaled(self):
+        product = self.add_product(self.upload('small.png', (300, 200), mode='RGB'))
+
+        self.assertEqual(product.image_variants['widths'], [240, 300])
+
+    def test_menu_uses_srcset(self):
+        self.add_product(self.upload('big.png', (1200, 800)))
+
+        response = self.client.get('/')
+
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '480w')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_new_image_replaces_old_derivatives(self):
+        product = self.add_product(self.upload('big.png', (1200, 800)))
+        old_files = list(product.image_variants['webp'].values())
+
+        product.image = self.upload('other.png', (800, 600), mode='RGB')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        product.refresh_from_db()
+
+        self.assertTrue(product.image_ready)
+        self.assertFalse(any(default_storage.exists(name) for name in old_files))
+
+    def test_backfill_command(self):
+        Product.objects.bulk_create([
+            Product(name='Старое блюдо', description='', price=100, image=self.upload('old.png', (640, 480)))
+        ])
+
+        call_command('build_product_images', workers=0, stdout=StringIO())
+
+        self.assertTrue(Product.objects.get().image_ready)
+
+    def test_backfill_reports_broken_images(self):
+        broken = default_storage.save('products/broken.png', ContentFile(b'not an image'))
+        Product.objects.bulk_create([
+            Product(name='Старое блюдо', description='', price=100, image=self.upload('old.png', (640, 480))),
+            Product(name='Битое блюдо', description='', price=100, image=broken),
+        ])
+        stdout, stderr = StringIO(), StringIO()
+
+        with self.assertRaisesMessage(CommandError, 'Не удалось обработать картинок: 1'):
+            call_command('build_product_images', workers=0, stdout=stdout, stderr=stderr)
+        # В пуле ошибку ещё и пишет в лог process_in_worker
+        with self.assertLogs('shkarik.images', 'WARNING'):
+            with self.assertRaisesMessage(CommandError, 'Не удалось обработать картинок: 1'):
+                call_command('build_product_images', workers=2, stdout=stdout, stderr=stderr)
+
+        self.assertIn(broken, stderr.getvalue())
+        self.assertIn('Обработано: 1, с ошибками: 1', stdout.getvalue())
+        self.assertTrue(Product.objects.get(name='Старое блюдо').image_ready)
+        self.assertFalse(Product.objects.get(name='Битое блюдо').image_ready)
+
+    def test_broken_upload_keeps_original(self):
+        broken = default_storage.save('products/broken.png', ContentFile(b'not an image'))
+
+        with self.assertLogs('shkarik.images', 'WARNING'):
+            product = self.add_product(broken)
+
+        self.assertFalse(product.image_ready)
+
+
+class OrderStatusTests(ShkarikTestCase):
+
+    def test_conditional_get_served_from_cache(self):
+        order = make_order()
+        url = f'/api/order-status/{order.secret_code}/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.json()['status'], 'new')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_status_change_invalidates_etag(self):
+        order = make_order()
+        url = f'/api/order-status/{order.secret_code}/'
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'cooking'
+            order.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'cooking')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unknown_code(self):
+        self.assertEqual(self.client.get('/api/order-status/nope/').status_code, 404)
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class OrderTransitionTests(ChefLoginMixin, ShkarikTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login_chef()
+
+    def post(self, order, status, **extra):
+        return self.client.post('/api/update/', json.dumps({
+            'public_code': order.public_code, 'status': status, **extra
+        }), content_type='application/json')
+
+    def test_single_conditional_update(self):
+        order = make_order()
+        version = order.version
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.post(order, 'cooking', expected_status='new').status_code, 200)
+
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "shkarik_order"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"status" IN', updates[0])
+        self.assertNotIn('client_name', updates[0])
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cooking')
+        self.assertGreater(order.version, version)
+
+    def test_second_courier_gets_conflict(self):
+        Courier.objects.create(name='Первый', code='c1')
+        Courier.objects.create(name='Второй', code='c2')
+        order = make_order(delivery_type='delivery', status='ready', address='ул. Ленина')
+
+        self.client.cookies[STAFF_TOKEN_COOKIE] = issue_token('courier', 'c1')
+        self.assertEqual(self.post(order, 'delivering', accepted_by='c1').status_code, 200)
+
+        self.client.cookies[STAFF_TOKEN_COOKIE] = issue_token('courier', 'c2')
+        response = self.post(order, 'delivering', expected_status='ready', accepted_by='c2')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], 'delivering')
+        self.assertEqual(Order.objects.get(pk=order.pk).accepted_by.code, 'c1')
+
+    def test_finished_order_cannot_go_back(self):
+        order = complete(make_order())
+
+        self.assertEqual(self.post(order, 'new').status_code, 400)
+        response = self.post(order, 'cooking')
+        self.assertEqual((response.status_code, response.json()['status']), (409, 'completed'))
+        self.assertEqual(self.post(order, 'ready', expected_status='completed').status_code, 400)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'completed')
+
+    def test_pickup_order_cannot_be_delivered(self):
+        Courier.objects.create(name='Курьер', code='c1')
+        order = make_order(status='ready')
+
+        response = self.post(order, 'delivering', accepted_by='c1')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'ready')
+
+    def test_unknown_order(self):
+        response = self.client.post('/api/update/', json.dumps({'public_code': '#NOPE', 'status': 'cooking'}),
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_completion_updates_rollups_cache_and_events(self):
+        order = make_order(status='ready')
+        status_url = f'/api/order-status/{order.secret_code}/'
+        self.client.get(status_url)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertEqual(self.post(order, 'completed', expected_status='ready').status_code, 200)
+
+        self.assertEqual(len(callbacks), 2)   # событие для панелей и кэш статуса
+        self.assertEqual(self.client.get(status_url).json()['status'], 'completed')
+        day = DailySales.objects.get()
+        self.assertEqual((day.completed, day.revenue), (1, 100))
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class BatchStatusTests(ChefLoginMixin, ShkarikTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login_chef()
+
+    def post(self, orders):
+        return self.client.post('/api/update/batch/', json.dumps({'orders': orders}),
+                                content_type='application/json')
+
+    def test_per_order_results(self):
+        cooking = make_order(status='cooking')
+        done = complete(make_order())
+        raced = make_order(status='ready')
+
+        response = self.post([
+            {'public_code': cooking.public_code, 'expected_status': 'cooking', 'status': 'ready'},
+            {'public_code': done.public_code, 'status': 'cancelled'},
+            {'public_code': raced.public_code, 'expected_status': 'cooking', 'status': 'ready'},
+            {'public_code': '#NOPE', 'expected_status': 'new', 'status': 'cooking'},
+            {'public_code': cooking.public_code, 'status': 'new'},
+        ])
+
+        self.assertEqual([(r['result'], r['status']) for r in response.json()['results']], [
+            ('ok', 'ready'), ('conflict', 'completed'), ('conflict', 'ready'), ('not_found', None), ('invalid', None),
+        ])
+        self.assertEqual(Order.objects.get(pk=cooking.pk).status, 'ready')
+        self.assertEqual(Order.objects.get(pk=done.pk).status, 'completed')
+
+    def test_one_update_whatever_the_batch_size(self):
+        orders = [make_order(status='ready') for _ in range(6)]
+
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.post([
+                {'public_code': order.public_code, 'expected_status': 'ready', 'status': 'completed'}
+                for order in orders
+            ])
+
+        self.assertEqual({r['result'] for r in response.json()['results']}, {'ok'})
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "shkarik_order"')]
+        self.assertEqual(len(updates), 1)
+        day = DailySales.objects.get()
+        self.assertEqual((day.completed, day.revenue), (6, 600))
+        self.assertEqual(DailyDishSales.objects.get().quantity, 6)
+        # У каждого заказа своя версия — дельты панелей и ETag статуса различают их
+        self.assertEqual(len(set(Order.objects.values_list('version', flat=True))), 6)
+
+    def test_courier_cannot_use_batch(self):
+        order = make_order()
+        self.client.cookies[STAFF_TOKEN_COOKIE] = issue_token('courier', 'c1')
+
+        response = self.post([{'public_code': order.public_code, 'status': 'cooking'}])
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_batch_size_limited(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post([{'public_code': 'x', 'status': 'ready'}] * 101).status_code, 400)
+
+    def test_admin_actions_follow_transitions(self):
+        owner = self.client_class()
+        owner.force_login(User.objects.create_superuser('owner', password='x'))
+        live = [make_order(status='cooking'), make_order(status='ready')]
+        done = complete(make_order())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = owner.post('/admin/shkarik/order/', {
+                'action': 'mark_completed', '_selected_action': [o.pk for o in [*live, done]],
+            }, follow=True)
+
+        self.assertEqual(
+            [m.message for m in response.context['messages']],
+            ['Изменено заказов: 1', 'Пропущено (из их статуса так нельзя): 2'],
+        )
+        self.assertEqual(
+            list(Order.objects.order_by('id').values_list('status', flat=True)), ['cooking', 'completed', 'completed']
+        )
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "shkarik_order"')]
+        self.assertEqual(len(updates), 1)
+
+
+class OrderEventsTests(ChefLoginMixin, ShkarikTestCase):
+
+    async def test_created_order_pushed_to_chef(self):
+        await sync_to_async(self.login_chef)()
+        response = await self.async_client.get('/api/events/')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+
+        def place_order():
+            with self.captureOnCommitCallbacks(execute=True):
+                return make_order()
+
+        order = await sync_to_async(place_order)()
+        chunk = await asyncio.wait_for(anext(stream), 1)
+
+        self.assertIn(b'event: order', chunk)
+        self.assertIn(order.public_code.encode(), chunk)
+        await response.streaming_content.aclose()
+
+    async def test_requires_staff_token(self):
+        response = await self.async_client.get('/api/events/')
+
+        self.assertEqual(response.status_code, 401)
+
+    async def test_courier_token_opens_stream(self):
+        await Courier.objects.acreate(name='Курьер', code='c1')
+        self.async_client.cookies[STAFF_TOKEN_COOKIE] = await sync_to_async(issue_token)('courier', 'c1')
+
+        response = await self.async_client.get('/api/events/')
+
+        self.assertEqual(response.status_code, 200)
+        await response.streaming_content.aclose()
+
+    async def test_revoked_token_rejected(self):
+        await sync_to_async(self.login_chef)()
+        await Chef.objects.filter(code='chef1').aupdate(is_active=False)
+        await sync_to_async(Courier.objects.create)(name='Курьер', code='c1')   # новая эпоха
+        await sync_to_async(reset_epoch_cache)()
+
+        response = await self.async_client.get('/api/events/')
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_wsgi_falls_back_to_polling(self):
+        response = self.client.get('/api/events/')
+
+        self.assertEqual(response.status_code, 204)
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class AsyncViewTests(ChefLoginMixin, ShkarikTestCase):
+
+    def test_hot_views_are_native_async(self):
+        for view in (views.create_order, views.get_orders, views.get_courier_orders,
+                     views.update_status, views.order_success):
+            self.assertTrue(iscoroutinefunction(view), view.__name__)
+
+    async def test_chef_polls_under_asgi(self):
+        await sync_to_async(self.login_chef)()
+        order = await sync_to_async(make_order)()
+
+        data = (await self.async_client.get('/api/orders/')).json()
+        self.assertEqual([o['public_code'] for o in data['orders']], [order.public_code])
+        self.assertEqual(data['orders'][0]['items'][0]['name'], 'Шаурма')
+
+        response = await self.async_client.get('/api/orders/', {'since': data['version']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_order_lifecycle_under_asgi(self):
+        await Courier.objects.acreate(name='Курьер', code='c1')
+        response = await self.async_client.post(
+            '/create-order/', json.dumps(order_payload(delivery_type='delivery', address='ул. Ленина, 1')),
+            content_type='application/json',
+        )
+        created = response.json()
+
+        page = await self.async_client.get(f"/order-success/{created['secret_code']}/")
+        self.assertEqual(page.context['order'].public_code, created['public_code'])
+
+        self.async_client.cookies[STAFF_TOKEN_COOKIE] = await sync_to_async(issue_token)('courier', 'c1')
+        self.assertEqual(len((await self.async_client.get('/api/courier/')).json()['orders']), 0)
+        await Order.objects.filter(public_code=created['public_code']).aupdate(status='ready')
+        self.assertEqual(len((await self.async_client.get('/api/courier/')).json()['orders']), 1)
+
+        response = await self.async_client.post('/api/update/', json.dumps({
+            'public_code': created['public_code'], 'status': 'delivering', 'accepted_by': 'c1',
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        order = await Order.objects.select_related('accepted_by').aget(public_code=created['public_code'])
+        self.assertEqual((order.status, order.accepted_by.code), ('delivering', 'c1'))
+
+    @override_settings(RATELIMIT_ENABLE=True)
+    async def test_rate_limit_applies_to_async_view(self):
+        async def post():
+            return await self.async_client.post(
+                '/create-order/', json.dumps(order_payload()), content_type='application/json'
+            )
+
+        for _ in range(10):
+            self.assertEqual((await post()).status_code, 200)
+        self.assertEqual((await post()).status_code, 429)
+
+
+class AsyncBenchmarkTests(SimpleTestCase):
+
+    def test_both_modes_answer_without_errors(self):
+        output = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(output))
+
+        run_command('bench_async', '--history', '100', '--clients', '1,12', '--requests', '5',
+                    '--slow-ms', '1', '--output', output)
+
+        with open(output) as file:
+            results = json.load(file)['results']
+        self.assertEqual([(row['mode'], row['clients']) for row in results],
+                         [('wsgi', 1), ('asgi', 1), ('wsgi', 12), ('asgi', 12)])
+        for row in results:
+            self.assertEqual(row['requests'], row['clients'] * 5)
+            self.assertEqual(row['errors'], 0)
+
+
+class PublicCodeAllocatorTests(ShkarikTestCase):
+
+    @override_settings(ORDER_PUBLIC_CODE_BLOCK=50)
+    def test_codes_unique_without_probes(self):
+        public_codes.allocate()
+
+        with self.assertNumQueries(0):
+            codes = [public_codes.allocate() for _ in range(49)]
+
+        self.assertEqual(len(set(codes)), 49)
+        self.assertTrue(all(len(code) == 5 and code.startswith('#') for code in codes))
+
+    @override_settings(ORDER_PUBLIC_CODE_LENGTH=2, ORDER_PUBLIC_CODE_BLOCK=100)
+    def test_full_cycle_is_permutation(self):
+        codes = {public_codes.allocate() for _ in range(36 ** 2)}
+
+        self.assertEqual(len(codes), 36 ** 2)
+
+    @override_settings(ORDER_PUBLIC_CODE_DAILY_PREFIX='%d')
+    def test_daily_prefix(self):
+        with mock.patch('shkarik.codes.timezone.localdate') as localdate:
+            localdate.return_value.strftime.return_value = '17'
+            code = public_codes.allocate()
+
+        self.assertTrue(code.startswith('#17'))
+        self.assertEqual(len(code), 7)
@@ -10,19 +10,28 @@ urlpatterns = [
     path('chef/login/', views.chef_login, name='chef_login'),
     path('chef/panel/', views.chef_panel, name='chef_panel'),
     path('chef/logout/', views.chef_logout, name='chef_logout'),
-    path('api/orders/', views.get_orders),
-    path('api/update/', views.update_status),
+    path('api/orders/', views.get_orders, name='get_orders'),
+    path('api/update/', views.update_status, name='update_status'),
+    path('api/update/batch/', views.update_status_batch, name='update_status_batch'),
     
     # Курьер
     path('courier/login/', views.courier_login, name='courier_login'),
     path('courier/orders/', views.courier_orders, name='courier_orders'),
     path('courier/logout/', views.courier_logout, name='courier_logout'),
-    path('api/courier/', views.get_courier_orders),
+    path('api/courier/', views.get_courier_orders, name='get_courier_orders'),
+    
+    # События заказов (SSE, под ASGI)
+    path('api/events/', views.order_events, name='order_events'),
     
     # Заказы
     path('create-order/', views.create_order, name='create_order'),
     path('order-success/<str:secret_code>/', views.order_success, name='order_success'),
+    path('api/order-status/<str:secret_code>/', views.order_status, name='order_status'),
 
     # Дашборд владельца (только для админов)
     path('xjf8k2n9s/', views.owner_dashboard, name='owner_dashboard'),
+
+    # Метрики запросов (Prometheus)
+    path('metrics/', views.metrics, name='metrics'),
+    path('metrics/slow-queries/', views.slow_queries_report, name='slow_queries'),
 ]
\ No newline at end of file
@@ -1,27 +1,83 @@
 import json           # для работы с JSON
+import os
 import re
-from datetime import timedelta
+from collections import Counter
+from datetime import datetime, time, timedelta
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
+from django.core.cache import cache
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, parse_etags
+from django.contrib import admin
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Q, Sum, Count
-from django.db.models.functions import ExtractHour
-from django_ratelimit.decorators import ratelimit
+from django.db.models import Q, Sum, Count, prefetch_related_objects
 
-from .models import Product, Order, OrderItem, Courier, Chef
+from .models import (
+    Product, Order, DeletedOrder, Courier, Chef, Sequence, ORDER_VERSION_SEQUENCE,
+    DailySales, HourlyOrders, DailyDishSales,
+)
+from .caching import (
+    MENU_PAGE_CACHE_SECONDS, menu_page_key, menu_version, order_status_key, remember_order_status,
+)
+from .archive import afind_order, find_order
+from .events import event_stream
+from .metrics import get_store, render_prometheus
+from .rollups import TERMINAL_STATUSES
+from .ratelimit import ratelimit
+from .services import (
+    BATCH_LIMIT, TransitionConflict, change_status, change_statuses, create_order_with_items, transition_sources,
+)
+from .slowlog import slow_queries
+from .staff import STAFF_TOKEN_COOKIE, set_token_cookie, staff_api
 
 
+# Статусы, которые видит повар
+CHEF_QUEUE_STATUSES = ['new', 'cooking']
+
+# Заказы в работе (ещё не попали в агрегаты продаж)
+ACTIVE_STATUSES = [s for s, _ in Order.STATUS_CHOICES if s not in TERMINAL_STATUSES]
+
+# Если повар отстал больше чем на столько версий — отдаём полный снимок
+CHEF_DELTA_LIMIT = 200
+
 
 # ==================== ГЛАВНАЯ СТРАНИЦА ====================
 
 @ensure_csrf_cookie
 def home(request):
-    products = Product.objects.filter(available=True)
-    return render(request, 'shkarik/index.html', {'products': products})
+    """
+    Главная с меню. Страница кэшируется целиком под версией каталога,
+    поэтому при тёплом кэше запрос не обращается к БД; повторные
+    визиты с If-None-Match / If-Modified-Since получают 304.
+    """
+    version = menu_version()
+    page = cache.get(menu_page_key(version))
+    if page is None:
+        products = Product.objects.filter(available=True)
+        page = {
+            'html': render_to_string('shkarik/index.html', {'products': products}, request),
+            'last_modified': int(timezone.now().timestamp()),
+        }
+        cache.set(menu_page_key(version), page, MENU_PAGE_CACHE_SECONDS)
+    
+    etag = f'"menu-{version}"'
+    response = get_conditional_response(request, etag=etag, last_modified=page['last_modified'])
+    if response is None:
+        response = HttpResponse(page['html'])
+    
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(page['last_modified'])
+    response['Cache-Control'] = 'no-cache'
+    return response
 
 
 # ==================== КОРЗИНА ====================
@@ -33,9 +89,9 @@ def cart_view(request):
 
 # ==================== СОЗДАНИЕ ЗАКАЗА ====================
 
-@ratelimit(key='ip', rate='10/m', method='POST')
+@ratelimit(key='ip', rate='10/m', method='POST', block=False)
 @require_http_methods(["POST"])
-def create_order(request):
+async def create_order(request):
     """Создание заказа с полной валидацией"""
     
     was_limited = getattr(request, 'limited', False)
@@ -155,7 +211,9 @@ def create_order(request):
     
     # === СОЗДАНИЕ ЗАКАЗА ===
     try:
-        order = Order.objects.create(
+        # Транзакция синхронная — вся запись заказа одним переходом в поток БД
+        order = await sync_to_async(create_order_with_items)(
+            cart,
             client_name=client_name,
             client_phone=client_phone,
             delivery_type=delivery_type,
@@ -166,14 +224,6 @@ def create_order(request):
             status='new'
         )
         
-        for item in cart:
-            OrderItem.objects.create(
-                order=order,
-                product_name=item['name'][:200],
-                product_price=int(item['price']),
-                quantity=int(item['quantity'])
-            )
-        
         return JsonResponse({
             'success': True,
             'public_code': order.public_code,
@@ -190,17 +240,44 @@ def create_order(request):
 
 # ==================== СТРАНИЦА УСПЕХА ====================
 
-def order_success(request, secret_code):
-    """Отслеживание заказа по секретному коду"""
+async def order_success(request, secret_code):
+    """Отслеживание заказа по секретному коду (в том числе уже перенесённого в архив)"""
     
     if len(secret_code) > 100:
         return render(request, 'shkarik/order_success.html', {'error': 'Неверная ссылка'})
     
-    try:
-        order = Order.objects.get(secret_code=secret_code)
-        return render(request, 'shkarik/order_success.html', {'order': order})
-    except Order.DoesNotExist:
+    order = await afind_order(secret_code)
+    if order is None:
         return render(request, 'shkarik/order_success.html', {'error': 'Заказ не найден'})
+    return render(request, 'shkarik/order_success.html', {'order': order})
+
+
+def order_status(request, secret_code):
+    """
+    Лёгкий JSON-статус заказа для страницы отслеживания.
+
+    Отдаёт ETag по версии заказа; повторный запрос с If-None-Match
+    получает 304 прямо из кэша, без обращения к БД.
+    """
+    
+    if len(secret_code) > 100:
+        return JsonResponse({'error': 'Неверная ссылка'}, status=400)
+    
+    entry = cache.get(order_status_key(secret_code))
+    if entry is None:
+        order = find_order(secret_code, fields=('secret_code', 'public_code', 'status', 'version'))
+        if order is None:
+            return JsonResponse({'error': 'Заказ не найден'}, status=404)
+        entry = remember_order_status(order)
+    
+    if entry['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(entry['data'])
+    
+    response['ETag'] = entry['etag']
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 # ==================== ПОВАР - ЗАЩИЩЁННЫЙ ДОСТУП ====================
@@ -225,7 +302,7 @@ def chef_login(request):
             request.session['chef_code'] = chef.code
             request.session['chef_name'] = chef.name
             
-            return redirect('chef_panel')
+            return set_token_cookie(redirect('chef_panel'), request, 'chef', chef.code)
         
         except Chef.DoesNotExist:
             return render(request, 'shkarik/chef_login.html', {
@@ -248,9 +325,11 @@ def chef_panel(request):
         del request.session['chef_name']
         return redirect('chef_login')
     
-    return render(request, 'shkarik/chef.html', {
+    response = render(request, 'shkarik/chef.html', {
         'chef_name': request.session.get('chef_name', 'Повар')
     })
+    # Токен для API панели: дальше запросы повара проверяются без сессии и БД
+    return set_token_cookie(response, request, 'chef', chef_code)
 
 
 def chef_logout(request):
@@ -261,55 +340,94 @@ def chef_logout(request):
     if 'chef_name' in request.session:
         del request.session['chef_name']
     
-    return redirect('chef_login')
+    response = redirect('chef_login')
+    response.delete_cookie(STAFF_TOKEN_COOKIE)
+    return response
+
+
+def _chef_order_json(o):
+    return {
+        "public_code": o.public_code,
+        "client_name": o.client_name,
+        "delivery_type": o.delivery_type,
+        "scheduled_time": o.scheduled_time,
+        "comment": o.comment,
+        "status": o.status,
+        "total_price": o.total_price,
+        "created_at": o.created_at.isoformat(),
+        "items": [
+            {
+                "name": i.product_name,
+                "qty": i.quantity,
+                "price": i.product_price
+            } for i in o.items.all()
+        ]
+    }
 
 
 @ratelimit(key='ip', rate='60/m', method='GET')
-def get_orders(request):
-    """API для получения заказов повара"""
+@staff_api('chef')
+async def get_orders(request):
+    """
+    API для получения заказов повара.
+
+    Без параметров — полный снимок очереди. С ?since=<version> — только заказы,
+    изменённые после этой версии (ушедшие из очереди и удалённые — в "removed"),
+    или 304, если ничего не менялось.
+    """
     
-    chef_code = request.session.get('chef_code')
-    if not chef_code or not Chef.objects.filter(code=chef_code, is_active=True).exists():
+    if request.staff is None:
         return JsonResponse({"error": "Unauthorized"}, status=401)
     
-    orders = Order.objects.filter(
-        status__in=['new', 'cooking']
-    ).order_by('-created_at')[:50]
+    # Версию читаем до заказов: изменение между запросами придёт повторно, но не потеряется
+    version = await Sequence.acurrent(ORDER_VERSION_SEQUENCE)
+    
+    since = request.GET.get('since', '')
+    since = int(since) if since.isdigit() else None
+    
+    if since == version:
+        return HttpResponseNotModified()
+    
+    if since is not None and 0 < version - since <= CHEF_DELTA_LIMIT:
+        changed = [o async for o in Order.objects.filter(version__gt=since).order_by('-created_at')]
+        active = [o for o in changed if o.status in CHEF_QUEUE_STATUSES]
+        await sync_to_async(prefetch_related_objects)(active, 'items')
+        removed = [o.public_code for o in changed if o.status not in CHEF_QUEUE_STATUSES]
+        removed += [code async for code in DeletedOrder.objects.filter(
+            version__gt=since
+        ).values_list('public_code', flat=True)]
+        
+        return JsonResponse({
+            "version": version,
+            "full": False,
+            "orders": [_chef_order_json(o) for o in active],
+            "removed": removed,
+        })
+    
+    orders = [o async for o in Order.objects.filter(
+        status__in=CHEF_QUEUE_STATUSES
+    ).order_by('-created_at').prefetch_related('items')[:50]]
     
     return JsonResponse({
-        "orders": [
-            {
-                "public_code": o.public_code,
-                "client_name": o.client_name,
-                "delivery_type": o.delivery_type,
-                "scheduled_time": o.scheduled_time,
-                "comment": o.comment,
-                "status": o.status,
-                "total_price": o.total_price,
-                "items": [
-                    {
-                        "name": i.product_name,
-                        "qty": i.quantity,
-                        "price": i.product_price
-                    } for i in o.items.all()
-                ]
-            } for o in orders
-        ]
+        "version": version,
+        "full": True,
+        "orders": [_chef_order_json(o) for o in orders]
     })
 
 
 @require_http_methods(["POST"])
 @ratelimit(key='ip', rate='30/m', method='POST')
-def update_status(request):
-    """Обновление статуса - ТОЛЬКО для авторизованных"""
-    
-    chef_code = request.session.get('chef_code')
-    courier_code_session = request.session.get('courier_code')
-    
-    is_chef = chef_code and Chef.objects.filter(code=chef_code, is_active=True).exists()
-    is_courier = courier_code_session and Courier.objects.filter(code=courier_code_session, is_active=True).exists()
+@staff_api('chef', 'courier')
+async def update_status(request):
+    """
+    Смена статуса - ТОЛЬКО для авторизованных.
+
+    Допустимые переходы — services.TRANSITIONS. Клиент может прислать
+    expected_status — статус, который он видел; если заказ уже изменил
+    кто-то другой (второй курьер взял тот же заказ), ответ 409 с текущим статусом.
+    """
     
-    if not (is_chef or is_courier):
+    if request.staff is None:
         return JsonResponse({"success": False, "error": "Unauthorized"}, status=401)
     
     try:
@@ -319,30 +437,79 @@ def update_status(request):
     
     code = data.get('public_code', '').strip()
     status = data.get('status', '').strip()
+    expected = data.get('expected_status', '').strip() or None
     courier_accept = data.get('accepted_by', '').strip()
     
-    valid_statuses = ['new', 'cooking', 'ready', 'delivering', 'completed', 'cancelled']
-    if status not in valid_statuses:
+    try:
+        transition_sources(status, expected)
+    except ValueError:
         return JsonResponse({"success": False, "error": "Неверный статус"}, status=400)
     
+    courier = None
+    if status == "delivering":
+        # Курьер может взять заказ только на себя — его код уже подтверждён токеном
+        if courier_accept and (request.staff.role != 'courier' or courier_accept == request.staff.code):
+            courier = await Courier.objects.filter(code=courier_accept, is_active=True).afirst()
+        
+        if courier is None:
+            return JsonResponse({"success": False, "error": "Курьер не найден"}, status=400)
+    
     try:
-        order = Order.objects.get(public_code=code)
+        await sync_to_async(change_status)(code, status, expected=expected, courier=courier)
     except Order.DoesNotExist:
         return JsonResponse({"success": False, "error": "Заказ не найден"}, status=404)
+    except ValueError:
+        return JsonResponse({"success": False, "error": "Недопустимый переход"}, status=400)
+    except TransitionConflict as conflict:
+        return JsonResponse({
+            "success": False,
+            "error": "Заказ уже изменён",
+            "status": conflict.current,
+        }, status=409)
     
-    if status == "delivering":
-        if courier_accept and Courier.objects.filter(code=courier_accept, is_active=True).exists():
-            order.accepted_by = courier_accept
-        else:
-            return JsonResponse({"success": False, "error": "Курьер не найден"}, status=400)
+    return JsonResponse({"success": True})
+
+
+@require_http_methods(["POST"])
+@ratelimit(key='ip', rate='30/m', method='POST')
+@staff_api('chef')
+async def update_status_batch(request):
+    """
+    Пакетная смена статусов для повара: несколько заказов одним запросом.
+
+    Тело: {"orders": [{"public_code": ..., "expected_status": ..., "status": ...}, ...]}.
+    Всё применяется одной транзакцией; в ответе итог по каждому заказу
+    ('ok', 'conflict', 'not_found', 'invalid') и его текущий статус.
+    """
     
-    if status in ["completed", "cancelled"]:
-        order.accepted_by = None
+    if request.staff is None:
+        return JsonResponse({"success": False, "error": "Unauthorized"}, status=401)
     
-    order.status = status
-    order.save()
+    try:
+        entries = json.loads(request.body).get('orders')
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({"success": False, "error": "Неверный формат"}, status=400)
     
-    return JsonResponse({"success": True})
+    if not isinstance(entries, list) or not entries or len(entries) > BATCH_LIMIT:
+        return JsonResponse({"success": False, "error": f"Нужно от 1 до {BATCH_LIMIT} заказов"}, status=400)
+    if not all(isinstance(entry, dict) for entry in entries):
+        return JsonResponse({"success": False, "error": "Неверный формат"}, status=400)
+    
+    results = await sync_to_async(change_statuses)([
+        (
+            str(entry.get('public_code', '')).strip(),
+            str(entry.get('expected_status') or '').strip() or None,
+            str(entry.get('status', '')).strip(),
+        ) for entry in entries
+    ])
+    
+    return JsonResponse({
+        "success": True,
+        "results": [
+            {"public_code": code, "result": result, "status": status}
+            for code, result, status in results
+        ],
+    })
 
 
 # ==================== КУРЬЕР ====================
@@ -367,7 +534,7 @@ def courier_login(request):
             request.session['courier_code'] = courier.code
             request.session['courier_name'] = courier.name
             
-            return redirect('courier_orders')
+            return set_token_cookie(redirect('courier_orders'), request, 'courier', courier.code)
         
         except Courier.DoesNotExist:
             return render(request, 'shkarik/courier_login.html', {
@@ -390,10 +557,12 @@ def courier_orders(request):
         del request.session['courier_name']
         return redirect('courier_login')
     
-    return render(request, 'shkarik/courier_orders.html', {
+    response = render(request, 'shkarik/courier_orders.html', {
         'courier_code': courier_code,
         'courier_name': request.session.get('courier_name', 'Курьер')
     })
+    # Токен для API панели: дальше запросы курьера проверяются без сессии и БД
+    return set_token_cookie(response, request, 'courier', courier_code)
 
 
 def courier_logout(request):
@@ -404,24 +573,27 @@ def courier_logout(request):
     if 'courier_name' in request.session:
         del request.session['courier_name']
     
-    return redirect('courier_login')
+    response = redirect('courier_login')
+    response.delete_cookie(STAFF_TOKEN_COOKIE)
+    return response
 
 
 @ratelimit(key='ip', rate='60/m', method='GET')
-def get_courier_orders(request):
-    """API для получения заказов курьера"""
+@staff_api('courier')
+async def get_courier_orders(request):
+    """API для получения заказов курьера (курьер определяется по токену)"""
     
-    courier_code = request.GET.get("code", "").strip()
-    
-    if not Courier.objects.filter(code=courier_code, is_active=True).exists():
+    if request.staff is None:
         return JsonResponse({"error": "Unauthorized"}, status=401)
     
-    orders = Order.objects.filter(
+    courier_code = request.staff.code
+    
+    orders = [o async for o in Order.objects.filter(
         delivery_type='delivery'
     ).filter(
         Q(status='ready') |
-        Q(status='delivering', accepted_by=courier_code)
-    ).order_by('-created_at')[:20]
+        Q(status='delivering', accepted_by__code=courier_code)
+    ).order_by('-created_at')[:20]]
     
     return JsonResponse({
         "orders": [
@@ -440,76 +612,95 @@ def get_courier_orders(request):
     })
 
 
+# ==================== СОБЫТИЯ ЗАКАЗОВ (SSE) ====================
+
+@staff_api('chef', 'courier')
+async def order_events(request):
+    """
+    Поток событий о заказах для панелей повара и курьера (Server-Sent Events).
+
+    Работает только под ASGI. Хаб событий локален для процесса, поэтому
+    панели продолжают редкий опрос API на случай событий из других воркеров.
+    Сотрудник определяется по токену, как в остальных API панелей.
+    """
+    
+    if not isinstance(request, ASGIRequest):
+        # 204 — EventSource перестаёт переподключаться, панель остаётся на опросе
+        return HttpResponse(status=204)
+    
+    if request.staff is None:
+        return JsonResponse({"error": "Unauthorized"}, status=401)
+    
+    if request.staff.role == 'courier':
+        accept = lambda event: event['delivery_type'] == 'delivery'
+    else:
+        accept = None
+    
+    response = StreamingHttpResponse(event_stream(accept), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # ==================== ДАШБОРД ВЛАДЕЛЬЦА ====================
 
 @staff_member_required
 def owner_dashboard(request):
     """Дашборд владельца - только для админов"""
-    now = timezone.now()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start = today_start - timedelta(days=6)   # 7 дней: today + previous 6 (total 7)
-    month_start = today_start - timedelta(days=30)
-
-    # === ВЫРУЧКА ===
-    revenue_today = Order.objects.filter(
-        created_at__gte=today_start,
-        status='completed'
-    ).aggregate(total=Sum('total_price'))['total'] or 0
-
-    revenue_week = Order.objects.filter(
-        created_at__gte=week_start,
-        status='completed'
-    ).aggregate(total=Sum('total_price'))['total'] or 0
-
-    revenue_month = Order.objects.filter(
-        created_at__gte=month_start,
-        status='completed'
-    ).aggregate(total=Sum('total_price'))['total'] or 0
-
-    # === ЗАКАЗЫ ===
-    orders_today = Order.objects.filter(created_at__gte=today_start).count()
-    orders_week = Order.objects.filter(created_at__gte=week_start).count()
-    orders_month = Order.objects.filter(created_at__gte=month_start).count()
+    # Завершённые заказы берутся из агрегатов (rollups.py), а ещё не завершённые —
+    # из небольшого "живого" набора заказов, которые в агрегаты пока не попали
+    today = timezone.localdate()
+    week_start = today - timedelta(days=6)   # 7 дней: today + previous 6 (total 7)
+    month_start = today - timedelta(days=30)
+
+    # === ИТОГИ ПО ДНЯМ (не больше 31 строки) ===
+    days = {row.date: row for row in DailySales.objects.filter(date__gte=month_start)}
+
+    # === ЖИВЫЕ ЗАКАЗЫ ===
+    live_created = [
+        timezone.localtime(created)
+        for created in Order.objects.filter(
+            status__in=ACTIVE_STATUSES,
+            created_at__gte=timezone.make_aware(datetime.combine(month_start, time.min))
+        ).values_list('created_at', flat=True)
+    ]
+
+    # === ВЫРУЧКА И ЗАКАЗЫ ===
+    def period_totals(start):
+        rows = [row for date, row in days.items() if date >= start]
+        live = sum(1 for created in live_created if created.date() >= start)
+        return sum(row.revenue for row in rows), sum(row.orders for row in rows) + live
+
+    revenue_today, orders_today = period_totals(today)
+    revenue_week, orders_week = period_totals(week_start)
+    revenue_month, orders_month = period_totals(month_start)
 
     # === ГРАФИК ПРОДАЖ ЗА НЕДЕЛЮ ===
     sales_by_day = []
     for i in range(7):
-        day_start = week_start + timedelta(days=i)
-        day_end = day_start + timedelta(days=1)
-        total = Order.objects.filter(
-            created_at__gte=day_start,
-            created_at__lt=day_end,
-            status='completed'
-        ).aggregate(total=Sum('total_price'))['total'] or 0
+        day = week_start + timedelta(days=i)
         sales_by_day.append({
-            'date': day_start.strftime('%d.%m'),
-            'total': float(total)
+            'date': day.strftime('%d.%m'),
+            'total': float(days[day].revenue if day in days else 0)
         })
 
     # === ТОП-5 БЛЮД (за месяц) ===
-    # Предполагается, что OrderItem хранит product_name, product_price и quantity
-    top_dishes_qs = (OrderItem.objects
-                     .filter(order__created_at__gte=month_start, order__status='completed')
-                     .values('product_name', 'product_price')
-                     .annotate(total_qty=Sum('quantity'))
+    top_dishes_qs = (DailyDishSales.objects
+                     .filter(date__gte=month_start)
+                     .values('product_name')
+                     .annotate(total_qty=Sum('quantity'), total_revenue=Sum('revenue'))
                      .order_by('-total_qty')[:5])
     top_dishes_list = []
     for dish in top_dishes_qs:
-        qty = int(dish['total_qty'] or 0)
-        price = float(dish['product_price'] or 0)
         top_dishes_list.append({
             'name': dish['product_name'],
-            'quantity': qty,
-            'revenue': round(price * qty, 2)
+            'quantity': dish['total_qty'],
+            'revenue': dish['total_revenue']
         })
 
     # === ЗАКАЗЫ ПО ЧАСАМ ===
-    orders_by_hour = (Order.objects
-                      .filter(created_at__gte=today_start)
-                      .annotate(hour=ExtractHour('created_at'))
-                      .values('hour')
-                      .annotate(count=Count('id'))
-                      .order_by('hour'))
+    orders_by_hour = Counter(dict(HourlyOrders.objects.filter(date=today).values_list('hour', 'orders')))
+    orders_by_hour.update(created.hour for created in live_created if created.date() == today)
 
     # БК: разбивка в слоты, как у тебя в коде
     slots = {
@@ -519,9 +710,7 @@ def owner_dashboard(request):
         '18-20': 0,
         '20-22': 0,
     }
-    for item in orders_by_hour:
-        hour = int(item['hour'])
-        c = item['count']
+    for hour, c in orders_by_hour.items():
         if 9 <= hour < 12:
             slots['09-12'] += c
         elif 12 <= hour < 14:
@@ -539,24 +728,21 @@ def owner_dashboard(request):
         percent = round((v / total_today_orders * 100) if total_today_orders else 0)
         time_slots_data.append({'slot': k, 'count': v, 'percent': percent})
 
-    # === КУРЬЕРЫ ===
+    # === КУРЬЕРЫ (одним запросом с JOIN по заказам) ===
+    couriers = Courier.objects.annotate(
+        deliveries=Count('orders', filter=Q(
+            orders__created_at__gte=timezone.make_aware(datetime.combine(today, time.min)),
+            orders__delivery_type='delivery'
+        )),
+        delivering=Count('orders', filter=Q(orders__status='delivering')),
+    )
     couriers_stats = []
-    couriers = Courier.objects.all()
     for courier in couriers:
-        deliveries_today = Order.objects.filter(
-            accepted_by=courier.code,
-            created_at__gte=today_start,
-            delivery_type='delivery'
-        ).count()
-        is_active_now = Order.objects.filter(
-            accepted_by=courier.code,
-            status='delivering'
-        ).exists()
         couriers_stats.append({
             'name': courier.name,
             'code': courier.code,
-            'deliveries': deliveries_today,
-            'is_active': is_active_now
+            'deliveries': courier.deliveries,
+            'is_active': courier.delivering > 0
         })
 
     context = {
@@ -571,4 +757,38 @@ def owner_dashboard(request):
         'time_slots': time_slots_data,
         'couriers_stats': couriers_stats,
     }
-    return render(request, 'shkarik/owner_dashboard.html', context)
\ No newline at end of file
+    return render(request, 'shkarik/owner_dashboard.html', context)
+
+
+# ==================== МЕТРИКИ ====================
+
+def metrics(request):
+    """
+    Гистограммы запросов всех воркеров в формате Prometheus.
+    Только для админов или с заголовком Authorization: Bearer <METRICS_TOKEN>.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    by_token = token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not by_token and not (request.user.is_active and request.user.is_staff):
+        return HttpResponse('Forbidden', status=403)
+
+    return HttpResponse(
+        render_prometheus(get_store().snapshot()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@staff_member_required
+def slow_queries_report(request):
+    """Самые дорогие SQL-отпечатки этого процесса (порог — SLOW_QUERY_MS)"""
+    if request.method == 'POST':
+        slow_queries.reset()
+        return redirect('slow_queries')
+
+    return render(request, 'shkarik/admin/slow_queries.html', {
+        **admin.site.each_context(request),
+        'title': 'Медленные SQL-запросы',
+        'queries': slow_queries.top(),
+        'threshold': settings.SLOW_QUERY_MS,
+        'pid': os.getpid(),
+    })